@@ -209,6 +209,8 @@ CV_ELEMENT_DIFF_RATIO = float(os.getenv('CV_ELEMENT_DIFF_RATIO', '0.12'))
 # Параметры YOLOv8 детектирования
 USE_YOLO_DETECTION = os.getenv('USE_YOLO_DETECTION', '1') == '1'  # Использовать ли YOLOv8 для детектирования
 YOLO_CONF_THRESHOLD = float(os.getenv('YOLO_CONF_THRESHOLD', '0.25'))  # Порог уверенности (0.0-1.0)
+YOLO_MAX_DET = int(os.getenv('YOLO_MAX_DET', '128'))  # Максимум детекций на изображение (для плотных дашбордов можно поднять до 500)
+YOLO_WARMUP_ON_STARTUP = os.getenv('YOLO_WARMUP_ON_STARTUP', '1') == '1'  # Загружать и прогревать модель в фоне при старте процесса
 
 CORS_ALLOW_ALL_ORIGINS = DEBUG
 CORS_ALLOWED_ORIGINS = [
@@ -1,6 +1,45 @@
+import logging
+import os
+import sys
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _warmup_yolo():
+    """Загружает и прогревает YOLOv8 в фоне, чтобы первый запрос не ждал инициализации модели."""
+    try:
+        from .yolo_detector import load_yolo_model
+        load_yolo_model()
+    except Exception as e:
+        logger.warning(f"YOLOv8 startup warmup failed: {e}")
+
+
+def _should_warmup_yolo() -> bool:
+    """
+    Прогрев нужен только в процессах, которые обслуживают запросы или задачи:
+    не в management-командах (migrate, collectstatic, test) и не в процессе-наблюдателе autoreload.
+    """
+    if not getattr(settings, 'YOLO_WARMUP_ON_STARTUP', True):
+        return False
+    if not getattr(settings, 'USE_YOLO_DETECTION', True):
+        return False
+    if os.path.basename(sys.argv[0]) == 'manage.py':
+        if len(sys.argv) < 2 or sys.argv[1] != 'runserver':
+            return False
+        # runserver с autoreload: модель нужна только в дочернем процессе, который обслуживает запросы
+        if '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+            return False
+    return True
 
 
 class TestsystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'testsystem'
+
+    def ready(self):
+        if _should_warmup_yolo():
+            threading.Thread(target=_warmup_yolo, name='yolo-warmup', daemon=True).start()
@@ -4,7 +4,9 @@
 import logging
 from typing import List
 
-from ..models import Run
+from django.db.models import Avg, Count, Q
+
+from ..models import Defect, Run
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +32,27 @@ def get_ci_status_summary(ci_job_id: str) -> dict:
             'defects_count': int,
         }
     """
-    runs = get_runs_by_ci_job(ci_job_id)
+    return summarize_runs(get_runs_by_ci_job(ci_job_id))
+
+
+def summarize_runs(runs) -> dict:
+    """
+    Сводка статусов по набору прогонов (QuerySet).
     
-    if not runs.exists():
+    Счётчики статусов и среднее покрытие считаются одним агрегирующим запросом,
+    дефекты — вторым (только если прогоны есть). Формат как у get_ci_status_summary.
+    """
+    stats = runs.order_by().aggregate(
+        total=Count('id'),
+        finished=Count('id', filter=Q(status='finished')),
+        failed=Count('id', filter=Q(status='failed')),
+        processing=Count('id', filter=Q(status='processing')),
+        queued=Count('id', filter=Q(status='queued')),
+        coverage_avg=Avg('coverage', filter=Q(status='finished', coverage__isnull=False)),
+    )
+    total = stats['total']
+    
+    if not total:
         return {
             'total_runs': 0,
             'finished': 0,
@@ -44,11 +64,10 @@ def get_ci_status_summary(ci_job_id: str) -> dict:
             'defects_count': 0,
         }
     
-    total = runs.count()
-    finished = runs.filter(status='finished').count()
-    failed = runs.filter(status='failed').count()
-    processing = runs.filter(status='processing').count()
-    queued = runs.filter(status='queued').count()
+    finished = stats['finished']
+    failed = stats['failed']
+    processing = stats['processing']
+    queued = stats['queued']
     
     # Определяем общий статус
     if failed > 0:
@@ -60,14 +79,8 @@ def get_ci_status_summary(ci_job_id: str) -> dict:
     else:
         overall_status = 'pending'
     
-    # Среднее покрытие
-    finished_runs = runs.filter(status='finished', coverage__isnull=False)
-    coverage_avg = 0.0
-    if finished_runs.exists():
-        coverage_avg = sum(run.coverage for run in finished_runs) / finished_runs.count()
-    
     # Общее количество дефектов
-    defects_count = sum(run.defects.count() for run in runs)
+    defects_count = Defect.objects.filter(run__in=runs.order_by().values('id')).count()
     
     return {
         'total_runs': total,
@@ -76,7 +89,6 @@ def get_ci_status_summary(ci_job_id: str) -> dict:
         'processing': processing,
         'queued': queued,
         'overall_status': overall_status,
-        'coverage_avg': round(coverage_avg, 2),
+        'coverage_avg': round(stats['coverage_avg'] or 0.0, 2),
         'defects_count': defects_count,
     }
-
@@ -4,6 +4,8 @@
 import cv2
 import numpy as np
 import logging
+import os
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional, Any
 from PIL import Image
 from django.conf import settings
@@ -26,6 +28,9 @@ except ImportError:
 MIN_ELEMENTS_TARGET = 12
 MIN_RELATIVE_AREA = 0.00002
 
+# Сколько декодированных изображений load_image_cached держит в памяти процесса
+IMAGE_CACHE_SIZE = getattr(settings, 'IMAGE_CACHE_SIZE', 8)
+
 # Попытка импортировать pytesseract (опционально)
 try:
     import pytesseract
@@ -64,6 +69,41 @@ def load_image(path: str) -> Optional[np.ndarray]:
         return None
 
 
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def _load_image_cached(path: str, mtime_ns: int) -> Optional[np.ndarray]:
+    img = load_image(path)
+    if img is not None:
+        # Массив общий для всех вызовов — запрещаем его изменять
+        img.flags.writeable = False
+    return img
+
+
+def load_image_cached(path: str) -> Optional[np.ndarray]:
+    """
+    Как load_image, но повторные загрузки того же файла берутся из кэша процесса.
+    Ключ кэша включает время изменения файла, поэтому замененный файл декодируется заново.
+    Возвращает массив только для чтения: перед рисованием на нем нужно сделать copy().
+    """
+    if not path:
+        return None
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return load_image(path)
+    return _load_image_cached(path, mtime_ns)
+
+
+def resize_to_reference(actual: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """
+    Приводит актуальный скриншот к размеру эталона.
+    Если размеры уже совпадают (обычный случай), возвращает исходный массив без копирования.
+    """
+    h, w = reference.shape[:2]
+    if actual.shape[:2] == (h, w):
+        return actual
+    return cv2.resize(actual, (w, h))
+
+
 def is_ocr_ready() -> bool:
     """Возвращает True, если OCR (tesseract) доступен для использования."""
     return OCR_AVAILABLE
@@ -131,9 +171,11 @@ def compute_diff_mask(
     threshold_value = max(5, int(diff_threshold * 255))
     _, mask = cv2.threshold(diff_norm, threshold_value, 255, cv2.THRESH_BINARY)
 
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    # Пустую маску (скриншоты совпали) морфологией не обрабатываем
+    if cv2.countNonZero(mask):
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
 
     return aligned_actual, mask, float(ssim_score)
 
@@ -157,40 +199,99 @@ def classify_element_type(
     Returns:
         Tuple (element_type, confidence)
     """
-    # Вычисляем абсолютные координаты с небольшим расширением для контекста
-    x = max(0, int(bbox['x'] * original_width))
-    y = max(0, int(bbox['y'] * original_height))
-    w = max(1, int(bbox['w'] * original_width))
-    h = max(1, int(bbox['h'] * original_height))
-    
-    # Извлекаем ROI (Region of Interest) с небольшим контекстом
-    context_pad = 2
-    x_start = max(0, x - context_pad)
-    y_start = max(0, y - context_pad)
-    x_end = min(original_width, x + w + context_pad)
-    y_end = min(original_height, y + h + context_pad)
+    x, y, w, h, x_start, y_start, x_end, y_end = _roi_bounds(bbox, original_width, original_height)
     roi = img[y_start:y_end, x_start:x_end]
     
     if roi.size == 0:
         return 'unknown', 0.0
     
-    # Вычисляем характеристики
-    aspect_ratio = w / max(h, 1)
-    area = w * h
-    total_area = original_width * original_height
-    relative_area = area / total_area
-    
     # Конвертируем в grayscale для анализа
     if len(roi.shape) == 3:
         gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        # Извлекаем внутреннюю область без контекста для анализа цвета
-        inner_roi = gray_roi[context_pad:context_pad+h, context_pad:context_pad+w] if roi.shape[0] > context_pad*2 and roi.shape[1] > context_pad*2 else gray_roi
+        inner_roi = _inner_roi(gray_roi, w, h)
     else:
         gray_roi = roi
         inner_roi = gray_roi
     
+    return _classify_gray_roi(gray_roi, inner_roi, w, h, original_width, original_height)
+
+
+def classify_element_types_batch(
+    img: np.ndarray,
+    bboxes: List[Dict[str, float]],
+    original_width: int,
+    original_height: int
+) -> List[Tuple[str, float]]:
+    """
+    Классифицирует сразу несколько элементов одного изображения.
+    Результат совпадает с вызовом classify_element_type для каждого bbox, но изображение
+    переводится в grayscale один раз для всех элементов, а не для каждого ROI.
+    
+    Returns:
+        Список (element_type, confidence) в порядке bboxes
+    """
+    is_color = len(img.shape) == 3
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if is_color else img
+    
+    results = []
+    for bbox in bboxes:
+        x, y, w, h, x_start, y_start, x_end, y_end = _roi_bounds(bbox, original_width, original_height)
+        gray_roi = gray[y_start:y_end, x_start:x_end]
+        if gray_roi.size == 0:
+            results.append(('unknown', 0.0))
+            continue
+        inner_roi = _inner_roi(gray_roi, w, h) if is_color else gray_roi
+        results.append(_classify_gray_roi(gray_roi, inner_roi, w, h, original_width, original_height))
+    return results
+
+
+# Расширение ROI вокруг элемента для контекста (в пикселях)
+ROI_CONTEXT_PAD = 2
+
+
+def _roi_bounds(bbox: Dict[str, float], original_width: int, original_height: int):
+    """
+    Абсолютные координаты элемента (x, y, w, h) и границы ROI с небольшим контекстом
+    (x_start, y_start, x_end, y_end).
+    """
+    x = max(0, int(bbox['x'] * original_width))
+    y = max(0, int(bbox['y'] * original_height))
+    w = max(1, int(bbox['w'] * original_width))
+    h = max(1, int(bbox['h'] * original_height))
+    
+    x_start = max(0, x - ROI_CONTEXT_PAD)
+    y_start = max(0, y - ROI_CONTEXT_PAD)
+    x_end = min(original_width, x + w + ROI_CONTEXT_PAD)
+    y_end = min(original_height, y + h + ROI_CONTEXT_PAD)
+    return x, y, w, h, x_start, y_start, x_end, y_end
+
+
+def _inner_roi(gray_roi: np.ndarray, w: int, h: int) -> np.ndarray:
+    """Внутренняя область ROI без контекста (для анализа цвета)."""
+    context_pad = ROI_CONTEXT_PAD
+    if gray_roi.shape[0] > context_pad * 2 and gray_roi.shape[1] > context_pad * 2:
+        inner_roi = gray_roi[context_pad:context_pad + h, context_pad:context_pad + w]
+    else:
+        inner_roi = gray_roi
     if inner_roi.size == 0:
         inner_roi = gray_roi
+    return inner_roi
+
+
+def _classify_gray_roi(
+    gray_roi: np.ndarray,
+    inner_roi: np.ndarray,
+    w: int,
+    h: int,
+    original_width: int,
+    original_height: int
+) -> Tuple[str, float]:
+    """Правила классификации по признакам grayscale ROI элемента (см. classify_element_type)."""
+    # Вычисляем характеристики
+    aspect_ratio = w / max(h, 1)
+    area = w * h
+    total_area = original_width * original_height
+    relative_area = area / total_area
     
     # Вычисляем среднюю яркость
     mean_brightness = np.mean(inner_roi)
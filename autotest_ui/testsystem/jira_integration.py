@@ -1,8 +1,11 @@
 """
 Интеграция с Jira для автоматического создания и обновления задач при обнаружении дефектов.
 """
+import hashlib
 import logging
-from typing import Optional, Dict, Any
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple
 from django.conf import settings
 from .models import Defect, Run
 
@@ -16,9 +19,25 @@ except ImportError:
     logger.warning("jira-python not installed. Jira integration disabled.")
 
 
+# Клиенты Jira по (url, пользователь, sha256 токена): повторные вызовы не открывают новое HTTPS-соединение
+_JIRA_CLIENTS = {}
+JIRA_CLIENT_CACHE_SIZE = 4
+
+# Клиенты для проверки подключения с введенными в форме учетными данными: ключ -> (клиент, время последнего использования)
+_JIRA_TEST_CLIENTS: Dict[Tuple[str, str, str], Tuple[Any, float]] = {}
+_JIRA_TEST_CLIENTS_LOCK = threading.Lock()
+JIRA_TEST_CLIENT_TTL = 60  # секунд
+
+
+def _client_key(jira_url: str, jira_username: str, jira_api_token: str) -> Tuple[str, str, str]:
+    """Ключ кэша клиента; сам токен в ключе не хранится."""
+    return (jira_url, jira_username, hashlib.sha256(jira_api_token.encode('utf-8')).hexdigest())
+
+
 def get_jira_client() -> Optional[JIRA]:
     """
     Создает и возвращает клиент Jira, если настройки доступны.
+    Созданный клиент переиспользуется, пока настройки не изменятся.
     """
     if not JIRA_AVAILABLE:
         return None
@@ -31,15 +50,67 @@ def get_jira_client() -> Optional[JIRA]:
         logger.debug("Jira credentials not configured")
         return None
     
+    cache_key = _client_key(jira_url, jira_username, jira_api_token)
+    jira = _JIRA_CLIENTS.get(cache_key)
+    if jira is not None:
+        return jira
+    
     try:
         jira = JIRA(
             server=jira_url,
             basic_auth=(jira_username, jira_api_token)
         )
-        return jira
     except Exception as e:
+        # Неудачное подключение не кэшируем — следующий вызов попробует снова
         logger.error(f"Failed to connect to Jira: {e}")
         return None
+    
+    if len(_JIRA_CLIENTS) >= JIRA_CLIENT_CACHE_SIZE:
+        _JIRA_CLIENTS.pop(next(iter(_JIRA_CLIENTS)), None)
+    _JIRA_CLIENTS[cache_key] = jira
+    return jira
+
+
+def clear_jira_client_cache():
+    """Сбрасывает кэш клиентов Jira (после изменения настроек)."""
+    _JIRA_CLIENTS.clear()
+
+
+def get_jira_test_client(jira_url: str, jira_username: str, jira_api_token: str) -> "JIRA":
+    """
+    Возвращает клиент Jira для проверки подключения с переданными учетными данными.
+    Клиент переиспользуется, если с ним работали не дольше JIRA_TEST_CLIENT_TTL секунд назад,
+    поэтому повторная проверка не открывает новое HTTPS-соединение.
+    
+    Raises:
+        Exception: если подключиться к Jira не удалось
+    """
+    cache_key = _client_key(jira_url, jira_username, jira_api_token)
+    now = time.monotonic()
+    
+    with _JIRA_TEST_CLIENTS_LOCK:
+        entry = _JIRA_TEST_CLIENTS.get(cache_key)
+        if entry is not None and now - entry[1] < JIRA_TEST_CLIENT_TTL:
+            _JIRA_TEST_CLIENTS[cache_key] = (entry[0], now)
+            return entry[0]
+        # Заодно убираем устаревшие клиенты
+        for key in [key for key, (_, last_used) in _JIRA_TEST_CLIENTS.items() if now - last_used >= JIRA_TEST_CLIENT_TTL]:
+            del _JIRA_TEST_CLIENTS[key]
+    
+    # Подключаемся вне блокировки: это сетевой запрос
+    jira = JIRA(
+        server=jira_url,
+        basic_auth=(jira_username, jira_api_token)
+    )
+    with _JIRA_TEST_CLIENTS_LOCK:
+        _JIRA_TEST_CLIENTS[cache_key] = (jira, time.monotonic())
+    return jira
+
+
+def evict_jira_test_client(jira_url: str, jira_username: str, jira_api_token: str):
+    """Удаляет клиент проверки подключения из пула (после ошибки запроса)."""
+    with _JIRA_TEST_CLIENTS_LOCK:
+        _JIRA_TEST_CLIENTS.pop(_client_key(jira_url, jira_username, jira_api_token), None)
 
 
 def create_jira_issue_from_defect(defect: Defect) -> Optional[str]:
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testsystem', '0006_run_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='comparison_vis_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='testcase',
+            name='elements_vis_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -9,6 +9,8 @@ import numpy as np
 import cv2
 from typing import Dict, List, Tuple, Optional
 
+from django.core.cache import cache
+
 # Безопасные импорты ML библиотек
 logger = logging.getLogger(__name__)
 
@@ -28,6 +30,10 @@ FEATURES_PATH = os.path.join(os.path.dirname(__file__), 'ml_models', 'features_d
 MODEL_DIR = os.path.dirname(MODEL_PATH)
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+# Статус обученности модели меняется редко, поэтому кэшируется вместо проверки файла на каждый вызов
+MODEL_TRAINED_CACHE_KEY = 'ml:model_trained'
+MODEL_TRAINED_CACHE_TIMEOUT = 60
+
 
 def extract_features(img: np.ndarray, bbox: Dict[str, float], img_width: int, img_height: int) -> np.ndarray:
     """
@@ -191,6 +197,7 @@ def train_model(X: np.ndarray, y: np.ndarray, test_size: float = 0.2, random_sta
     
     # Сохраняем модель
     joblib.dump(model, MODEL_PATH)
+    clear_model_trained_cache()
     logger.info(f"Model saved to {MODEL_PATH}")
     logger.info(f"Training accuracy: {accuracy:.3f}")
     
@@ -259,9 +266,19 @@ def predict_element_type(
         return fallback_type, 0.0
 
 
+def _check_model_file() -> bool:
+    """Файл модели существует и не пустой."""
+    return os.path.exists(MODEL_PATH) and os.path.getsize(MODEL_PATH) > 0
+
+
 def is_model_trained() -> bool:
-    """Проверяет, обучена ли модель."""
+    """Проверяет, обучена ли модель (результат кэшируется на MODEL_TRAINED_CACHE_TIMEOUT секунд)."""
     if not ML_AVAILABLE:
         return False
-    return os.path.exists(MODEL_PATH) and os.path.getsize(MODEL_PATH) > 0
+    return cache.get_or_set(MODEL_TRAINED_CACHE_KEY, _check_model_file, MODEL_TRAINED_CACHE_TIMEOUT)
+
+
+def clear_model_trained_cache():
+    """Сбрасывает кэш статуса модели (вызывается после обучения)."""
+    cache.delete(MODEL_TRAINED_CACHE_KEY)
 
@@ -30,10 +30,36 @@ class Run(models.Model):
     ci_job_id = models.CharField(max_length=128, blank=True)
     task_tracker_issue = models.CharField(max_length=128, blank=True)
     error_message = models.TextField(blank=True)
+    # Визуализация различий (путь относительно MEDIA_ROOT), строится задачей сравнения
+    comparison_vis_path = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            # CI/CD дашборд и API: фильтр по ci_job_id + сортировка/диапазон по started_at
+            models.Index(fields=['ci_job_id', '-started_at'], name='run_ci_job_started_idx'),
+            models.Index(fields=['status', 'ci_job_id'], name='run_status_ci_job_idx'),
+            # Прогоны пользователя (фильтрация по started_by в API)
+            models.Index(fields=['started_by', 'started_at'], name='run_started_by_at_idx'),
+        ]
 
     def __str__(self):
         return f"Run {self.id} tc={self.testcase_id} status={self.status}"
 
+    def mark_processing(self):
+        """
+        Переводит прогон в 'processing' одним UPDATE после постановки задачи в очередь.
+        Обновление выполняется, только если статус и finished_at не изменились с момента
+        загрузки прогона, — результат уже отработавшей задачи не перезаписывается.
+        """
+        updated = Run.objects.filter(
+            pk=self.pk,
+            status=self.status,
+            finished_at=self.finished_at,
+        ).update(status='processing')
+        if updated:
+            self.status = 'processing'
+        return bool(updated)
+
 class TestCase(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -51,6 +77,8 @@ class TestCase(models.Model):
         ('ready', 'Ready'),
     ]
     status = models.CharField(max_length=32, choices=STATUS_CHOICES, default='new')
+    # Визуализация найденных элементов (путь относительно MEDIA_ROOT), строится задачей анализа
+    elements_vis_path = models.CharField(max_length=255, blank=True)
 
     def __str__(self):
         return f"{self.id} - {self.title}"
@@ -0,0 +1,26 @@
+"""
+Классы пагинации для API.
+"""
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class CIRunCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация прогонов CI/CD сборки (от новых к старым).
+
+    get_paginated_response принимает словарь с данными ответа (summary, runs)
+    и добавляет к нему ссылки next/previous, сохраняя прежнюю структуру ответа.
+    """
+
+    ordering = '-started_at'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            **data,
+        })
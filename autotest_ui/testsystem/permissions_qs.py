@@ -0,0 +1,25 @@
+"""
+Общие подзапросы видимости объектов для обычных (не административных) пользователей.
+
+Функции возвращают ленивые QuerySet'ы с одним столбцом id, которые подставляются
+в фильтры как `__in` подзапросы, — так все API endpoints используют один и тот же
+предикат доступа, а база планирует его как полусоединение без DISTINCT.
+"""
+from django.db.models import Q
+
+from .models import Run, TestCase
+
+
+def user_testcase_ids(user):
+    """id тест-кейсов, созданных пользователем."""
+    return TestCase.objects.filter(created_by=user).values('id')
+
+
+def user_visible_run_ids(user):
+    """
+    id прогонов, доступных пользователю:
+    запущенных им самим или относящихся к его тест-кейсам.
+    """
+    return Run.objects.filter(
+        Q(started_by=user) | Q(testcase_id__in=user_testcase_ids(user))
+    ).values('id')
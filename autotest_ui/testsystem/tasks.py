@@ -9,6 +9,12 @@ from .cv_utils import (
     load_image,
     analyze_elements_diff,
     compute_diff_mask,
+    resize_to_reference,
+)
+from .visualization import (
+    discard_visualization,
+    render_comparison_visualization,
+    render_elements_visualization,
 )
 try:
     from .ml_classifier import predict_element_type, is_model_trained
@@ -65,6 +71,7 @@ def generate_test_from_screenshot(self, testcase_id):
     tc.elements.all().delete()
 
     saved = 0
+    created_elements = []
     total_pixels = w * h
     for elem_data in elements_data:
         bbox = elem_data['bbox']
@@ -157,7 +164,7 @@ def generate_test_from_screenshot(self, testcase_id):
         # Обновляем confidence с учетом классификации
         final_confidence = (confidence + type_confidence) / 2.0
 
-        UIElement.objects.create(
+        element = UIElement.objects.create(
             testcase=tc,
             name=display_name,
             text='',  # OCR убран - текст не извлекается
@@ -165,6 +172,7 @@ def generate_test_from_screenshot(self, testcase_id):
             bbox=bbox,
             confidence=float(final_confidence)
         )
+        created_elements.append(element)
         saved += 1
 
     # Если ничего не найдено — логируем предупреждение
@@ -173,9 +181,16 @@ def generate_test_from_screenshot(self, testcase_id):
         logger = logging.getLogger(__name__)
         logger.warning(f"No elements found for testcase {testcase_id}. Image size: {w}x{h}")
     
+    # Визуализацию строим здесь, чтобы страница тест-кейса не обрабатывала изображение
+    if created_elements:
+        tc.elements_vis_path = render_elements_visualization(tc, img, created_elements) or ''
+    else:
+        discard_visualization(tc.elements_vis_path)
+        tc.elements_vis_path = ''
+
     # Помечаем как analyzed в любом случае
     tc.status = 'analyzed'
-    tc.save(update_fields=['status'])
+    tc.save(update_fields=['status', 'elements_vis_path'])
 
     return {'status': 'done', 'elements_saved': saved, 'image_size': f'{w}x{h}'}
 
@@ -183,7 +198,7 @@ def generate_test_from_screenshot(self, testcase_id):
 @shared_task(bind=True)
 def compare_reference_with_actual(self, run_id):
     try:
-        run = Run.objects.select_related('testcase').get(pk=run_id)
+        run = Run.objects.select_related('testcase').prefetch_related('testcase__elements').get(pk=run_id)
     except Run.DoesNotExist:
         return {'error': 'Run not found', 'id': run_id}
 
@@ -213,20 +228,23 @@ def compare_reference_with_actual(self, run_id):
         run.save(update_fields=['status', 'error_message', 'finished_at'])
         return {'error': 'cv2 error'}
 
-    h, w = reference.shape[:2]
-    actual_resized = cv2.resize(actual, (w, h))
+    # Параметры сравнения читаем из settings один раз
+    diff_threshold = getattr(settings, 'CV_DIFF_TOLERANCE', 0.12)
+    element_diff_ratio = getattr(settings, 'CV_ELEMENT_DIFF_RATIO', 0.12)
+
+    actual_resized = resize_to_reference(actual, reference)
 
     aligned_actual, diff_mask, ssim_score = compute_diff_mask(
         reference,
         actual_resized,
-        diff_threshold=getattr(settings, 'CV_DIFF_TOLERANCE', 0.12),
+        diff_threshold=diff_threshold,
     )
     mismatched_pixels = int(np.count_nonzero(diff_mask))
     total_pixels = diff_mask.size
     mismatch_ratio = mismatched_pixels / max(1, total_pixels)
-    diff_threshold = getattr(settings, 'CV_DIFF_TOLERANCE', 0.12)
 
-    total_elements = testcase.elements.count()
+    # Элементы подгружены prefetch_related и переиспользуются в analyze_elements_diff
+    total_elements = len(testcase.elements.all())
     matched_elements = int(max(0, total_elements * (1 - mismatch_ratio)))
     mismatched_elements = max(0, total_elements - matched_elements)
     coverage_percent = 0.0 if total_elements == 0 else (matched_elements / total_elements) * 100
@@ -235,8 +253,8 @@ def compare_reference_with_actual(self, run_id):
         testcase,
         diff_mask,
         missing_threshold=min(0.95, diff_threshold + 0.45),
-        changed_threshold=max(0.15, getattr(settings, 'CV_ELEMENT_DIFF_RATIO', 0.12)),
-        min_ratio=getattr(settings, 'CV_ELEMENT_DIFF_RATIO', 0.12),
+        changed_threshold=max(0.15, element_diff_ratio),
+        min_ratio=element_diff_ratio,
         max_shift_px=getattr(settings, 'CV_ELEMENT_SHIFT_PX', 18),
     )
     try:
@@ -244,6 +262,9 @@ def compare_reference_with_actual(self, run_id):
     except TypeError:
         run.details = ''
 
+    # Визуализацию различий строим здесь, чтобы страница прогона не обрабатывала изображения
+    run.comparison_vis_path = render_comparison_visualization(run, reference, diff_mask, element_diagnostics) or ''
+
     CoverageMetric.objects.update_or_create(
         run=run,
         defaults={
@@ -284,7 +305,7 @@ def compare_reference_with_actual(self, run_id):
     run.reference_diff_score = ssim_score
     run.coverage = coverage_percent
     run.error_message = ''
-    run.save(update_fields=['status', 'finished_at', 'reference_diff_score', 'coverage', 'error_message', 'details'])
+    run.save(update_fields=['status', 'finished_at', 'reference_diff_score', 'coverage', 'error_message', 'details', 'comparison_vis_path'])
 
     # Отправляем callback в CI/CD систему, если есть ci_job_id
     if run.ci_job_id:
@@ -302,3 +323,26 @@ def compare_reference_with_actual(self, run_id):
         'coverage_percent': coverage_percent,
         'mismatch_ratio': mismatch_ratio,
     }
+
+
+@shared_task
+def delete_media_files(paths):
+    """
+    Удаляет файлы из хранилища медиа (скриншоты, визуализации) после удаления записей.
+    paths — имена файлов относительно хранилища; отсутствующие файлы пропускаются.
+    """
+    import logging
+    from django.core.files.storage import default_storage
+
+    logger = logging.getLogger(__name__)
+    deleted = 0
+    for path in paths:
+        if not path:
+            continue
+        try:
+            default_storage.delete(path)
+            deleted += 1
+        except Exception as e:
+            logger.warning(f"Failed to delete media file {path}: {e}")
+
+    return {'status': 'done', 'deleted': deleted}
@@ -25,3 +25,161 @@ class CoverageMetricModelTest(TestCase):
             coverage_percent=80.0,
         )
         self.assertIn('80.00', str(metric))
+
+
+class CIStatusPaginationTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='ci', password='secret-pass')
+        self.testcase = UITestCase.objects.create(
+            title='Checkout',
+            created_by=self.user,
+            reference_screenshot=SimpleUploadedFile('ref.png', b'fake', content_type='image/png'),
+        )
+        for _ in range(3):
+            Run.objects.create(testcase=self.testcase, started_by=self.user, ci_job_id='build-1', status='finished')
+        self.client.force_login(self.user)
+
+    def test_status_api_is_paginated(self):
+        response = self.client.get('/cicd/status/', {'ci_job_id': 'build-1', 'limit': 2})
+        data = response.json()
+        self.assertEqual(data['total_runs'], 3)
+        self.assertEqual(len(data['runs']), 2)
+        self.assertIsNotNone(data['next'])
+        self.assertIsNone(data['previous'])
+
+        response = self.client.get('/cicd/status/', {'ci_job_id': 'build-1', 'limit': 2, 'offset': 2})
+        data = response.json()
+        self.assertEqual(len(data['runs']), 1)
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_ci_status_keeps_summary_with_cursor_page(self):
+        response = self.client.get('/api/runs/ci_status/', {'ci_job_id': 'build-1', 'page_size': 2})
+        data = response.json()
+        self.assertEqual(data['summary']['total_runs'], 3)
+        self.assertEqual(len(data['runs']), 2)
+        self.assertIsNotNone(data['next'])
+
+    def test_dashboard_paginates_jobs(self):
+        response = self.client.get('/cicd/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_jobs'], 1)
+        self.assertEqual(len(response.context['ci_jobs']), 1)
+
+    def test_timeline_counts_current_hour(self):
+        response = self.client.get('/cicd/timeline/', {'days': 1})
+        buckets = response.json()['buckets']
+        self.assertEqual(len(buckets), 25)
+        self.assertEqual(buckets[-1]['counts'], {'finished': 3})
+
+
+class UserVisibleRunsTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create(username='owner')
+        self.runner = User.objects.create(username='runner')
+        self.stranger = User.objects.create(username='stranger')
+        self.testcase = UITestCase.objects.create(
+            title='Profile',
+            created_by=self.owner,
+            reference_screenshot=SimpleUploadedFile('ref.png', b'fake', content_type='image/png'),
+        )
+        self.run = Run.objects.create(testcase=self.testcase, started_by=self.runner)
+
+    def test_owner_and_runner_see_run(self):
+        from .permissions_qs import user_visible_run_ids
+
+        for user in (self.owner, self.runner):
+            with self.assertNumQueries(1):
+                ids = [row['id'] for row in user_visible_run_ids(user)]
+            self.assertEqual(ids, [self.run.id])
+        self.assertFalse(user_visible_run_ids(self.stranger).exists())
+
+    def test_mark_processing_keeps_finished_result(self):
+        from django.utils import timezone
+
+        stale = Run.objects.get(pk=self.run.pk)
+        Run.objects.filter(pk=self.run.pk).update(status='finished', finished_at=timezone.now())
+
+        self.assertFalse(stale.mark_processing())
+        self.assertEqual(Run.objects.get(pk=self.run.pk).status, 'finished')
+        self.assertTrue(Run.objects.get(pk=self.run.pk).mark_processing())
+
+
+class ListViewsQueryCountTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='lister', password='secret-pass')
+        self.client.force_login(self.user)
+
+    def _add_testcase_with_run(self):
+        testcase = UITestCase.objects.create(
+            title='Page',
+            created_by=self.user,
+            reference_screenshot=SimpleUploadedFile('ref.png', b'fake', content_type='image/png'),
+        )
+        Run.objects.create(testcase=testcase, started_by=self.user)
+
+    def _count_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_index_counts_are_cached(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self._add_testcase_with_run()
+        first = self._count_queries('/')
+        self._add_testcase_with_run()
+        self.assertEqual(self._count_queries('/'), first - 2)
+        self.assertEqual(self.client.get('/').context['testcases_count'], 1)
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        from django.core.cache import cache
+
+        urls = ('/', '/runs/', '/testcases/')
+        self._add_testcase_with_run()
+        baseline = {}
+        for url in urls:
+            cache.clear()
+            baseline[url] = self._count_queries(url)
+        for _ in range(3):
+            self._add_testcase_with_run()
+        for url in urls:
+            cache.clear()
+            self.assertEqual(self._count_queries(url), baseline[url], url)
+
+    def test_approve_elements_queries_do_not_grow(self):
+        import json
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import UIElement
+
+        testcase = UITestCase.objects.create(
+            title='Approve',
+            created_by=self.user,
+            reference_screenshot=SimpleUploadedFile('ref.png', b'fake', content_type='image/png'),
+        )
+
+        def approve(elements_count):
+            UIElement.objects.filter(testcase=testcase).delete()
+            ids = [
+                UIElement.objects.create(
+                    testcase=testcase, element_type='button', bbox={'x': 0, 'y': 0, 'w': 0.5, 'h': 0.1},
+                ).id
+                for _ in range(elements_count)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(
+                    f'/testcase/{testcase.id}/approve-elements/',
+                    data=json.dumps({'approved_element_ids': ids[:1]}),
+                    content_type='application/json',
+                )
+            self.assertEqual(response.json()['approved_count'], 1)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(approve(5), approve(2))
@@ -27,6 +27,7 @@ from .views_cicd import (
     cicd_dashboard,
     cicd_job_detail,
     cicd_status_api,
+    cicd_timeline_api,
 )
 
 urlpatterns = [
@@ -53,6 +54,7 @@ urlpatterns = [
     path('cicd/', cicd_dashboard, name='cicd_dashboard'),
     path('cicd/job/<str:job_id>/', cicd_job_detail, name='cicd_job_detail'),
     path('cicd/status/', cicd_status_api, name='cicd_status_api'),
+    path('cicd/timeline/', cicd_timeline_api, name='cicd_timeline_api'),
     
     # ML и настройки
     path('ml/train/', train_ml_model, name='train_ml_model'),
@@ -1,6 +1,7 @@
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.exceptions import ValidationError as DjangoValidationError
@@ -14,10 +15,36 @@ from .serializers import (
     UIElementSerializer,
 )
 from .tasks import compare_reference_with_actual, generate_test_from_screenshot
-from .ci_integration.utils import get_ci_status_summary
+from .ci_integration.utils import summarize_runs
+from .pagination import CIRunCursorPagination
+from .permissions_qs import user_testcase_ids, user_visible_run_ids
 from .validators import validate_image_file
 
 
+def is_admin_request(request):
+    """
+    Признак администратора для запроса.
+    Берётся из request.is_admin (см. AdminFlagMixin), иначе вычисляется по пользователю.
+    """
+    is_admin = getattr(request, 'is_admin', None)
+    if is_admin is None:
+        user = request.user
+        is_admin = bool(user and (user.is_superuser or user.is_staff))
+    return is_admin
+
+
+class AdminFlagMixin:
+    """
+    Вычисляет признак администратора один раз в начале запроса
+    и сохраняет его в request.is_admin для permissions, get_queryset и perform_destroy.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        user = request.user
+        request.is_admin = bool(user and (user.is_superuser or user.is_staff))
+        super().initial(request, *args, **kwargs)
+
+
 class IsOwnerOrAdmin(permissions.BasePermission):
     """
     Кастомное разрешение:
@@ -27,7 +54,7 @@ class IsOwnerOrAdmin(permissions.BasePermission):
     
     def has_object_permission(self, request, view, obj):
         # Администраторы могут всё
-        if request.user.is_superuser or request.user.is_staff:
+        if is_admin_request(request):
             return True
         
         # Для TestCase проверяем created_by
@@ -46,26 +73,29 @@ class IsOwnerOrAdmin(permissions.BasePermission):
         return False
 
 
-class TestCaseViewSet(viewsets.ModelViewSet):
+class TestCaseViewSet(AdminFlagMixin, viewsets.ModelViewSet):
     serializer_class = TestCaseSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'created_by']
+    ordering_fields = ['created_at', 'status']
+    ordering = ['-created_at']
     
     def get_queryset(self):
         """
         Фильтрация тест-кейсов:
         - Администраторы видят все тест-кейсы
         - Обычные пользователи видят только свои
+        Сортировку задаёт OrderingFilter (по умолчанию -created_at).
         """
         user = self.request.user
         
         # Администраторы видят всё
-        if user.is_superuser or user.is_staff:
-            return TestCase.objects.all().order_by('-created_at')
+        if is_admin_request(self.request):
+            return TestCase.objects.all()
         
         # Обычные пользователи видят только свои тест-кейсы
-        return TestCase.objects.filter(created_by=user).order_by('-created_at')
+        return TestCase.objects.filter(created_by=user)
     
     def perform_create(self, serializer):
         """
@@ -89,7 +119,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # Администраторы могут удалять все
-        if user.is_superuser or user.is_staff:
+        if is_admin_request(self.request):
             super().perform_destroy(instance)
             return
         
@@ -116,11 +146,13 @@ class TestCaseViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class RunViewSet(viewsets.ModelViewSet):
+class RunViewSet(AdminFlagMixin, viewsets.ModelViewSet):
     serializer_class = RunSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['ci_job_id', 'status', 'testcase', 'started_by']
+    ordering_fields = ['started_at', 'finished_at', 'status']
+    ordering = ['-started_at']
     
     def get_queryset(self):
         """
@@ -134,16 +166,13 @@ class RunViewSet(viewsets.ModelViewSet):
         ).prefetch_related('defects')
         
         # Администраторы видят всё
-        if user.is_superuser or user.is_staff:
+        if is_admin_request(self.request):
             return queryset
         
         # Обычные пользователи видят:
         # 1. Прогоны, которые они сами запустили (started_by)
         # 2. Прогоны тест-кейсов, которые они создали (testcase.created_by)
-        from django.db.models import Q
-        return queryset.filter(
-            Q(started_by=user) | Q(testcase__created_by=user)
-        ).distinct()
+        return queryset.filter(id__in=user_visible_run_ids(user))
     
     def perform_create(self, serializer):
         """
@@ -170,7 +199,7 @@ class RunViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # Администраторы могут удалять все
-        if user.is_superuser or user.is_staff:
+        if is_admin_request(self.request):
             super().perform_destroy(instance)
             return
         
@@ -195,8 +224,7 @@ class RunViewSet(viewsets.ModelViewSet):
         """
         run = self.get_object()
         job = compare_reference_with_actual.delay(run.id)
-        run.status = 'processing'
-        run.save(update_fields=['status'])
+        run.mark_processing()
         return Response({'task_id': job.id, 'status': 'processing'})
 
     @action(detail=False, methods=['get'])
@@ -209,13 +237,24 @@ class RunViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        summary = get_ci_status_summary(ci_job_id)
-        
         # Применяем фильтрацию по пользователю
-        runs = self.get_queryset().filter(ci_job_id=ci_job_id).order_by('-started_at')
-        serializer = RunSerializer(runs, many=True)
+        runs = self.get_queryset().filter(ci_job_id=ci_job_id)
         
-        return Response({
+        # Сводка по всем доступным прогонам сборки (агрегат, независимо от страницы)
+        summary = summarize_runs(runs)
+        if not summary['total_runs']:
+            return Response({
+                'next': None,
+                'previous': None,
+                'summary': summary,
+                'runs': [],
+            })
+        
+        paginator = CIRunCursorPagination()
+        page = paginator.paginate_queryset(runs, request, view=self)
+        serializer = RunSerializer(page, many=True)
+        
+        return paginator.get_paginated_response({
             'summary': summary,
             'runs': serializer.data
         })
@@ -236,7 +275,7 @@ class RunViewSet(viewsets.ModelViewSet):
         })
 
 
-class UIElementViewSet(viewsets.ReadOnlyModelViewSet):
+class UIElementViewSet(AdminFlagMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = UIElementSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -250,14 +289,14 @@ class UIElementViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = UIElement.objects.select_related('testcase').all()
         
         # Администраторы видят всё
-        if user.is_superuser or user.is_staff:
+        if is_admin_request(self.request):
             return queryset
         
         # Обычные пользователи видят только элементы своих тест-кейсов
-        return queryset.filter(testcase__created_by=user)
+        return queryset.filter(testcase_id__in=user_testcase_ids(user))
 
 
-class DefectViewSet(viewsets.ReadOnlyModelViewSet):
+class DefectViewSet(AdminFlagMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = DefectSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -271,14 +310,14 @@ class DefectViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = Defect.objects.select_related('testcase', 'run', 'element').all()
         
         # Администраторы видят всё
-        if user.is_superuser or user.is_staff:
+        if is_admin_request(self.request):
             return queryset
         
         # Обычные пользователи видят только дефекты своих тест-кейсов
-        return queryset.filter(testcase__created_by=user)
+        return queryset.filter(testcase_id__in=user_testcase_ids(user))
 
 
-class CoverageMetricViewSet(viewsets.ReadOnlyModelViewSet):
+class CoverageMetricViewSet(AdminFlagMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = CoverageMetricSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -292,11 +331,9 @@ class CoverageMetricViewSet(viewsets.ReadOnlyModelViewSet):
         queryset = CoverageMetric.objects.select_related('run').all()
         
         # Администраторы видят всё
-        if user.is_superuser or user.is_staff:
+        if is_admin_request(self.request):
             return queryset
         
-        # Обычные пользователи видят метрики своих прогонов или прогонов своих тест-кейсов
-        from django.db.models import Q
-        return queryset.filter(
-            Q(run__started_by=user) | Q(run__testcase__created_by=user)
-        ).distinct()
+        # Обычные пользователи видят метрики своих прогонов или прогонов своих тест-кейсов.
+        # Подзапрос вместо JOIN + DISTINCT: метрика связана с прогоном один к одному.
+        return queryset.filter(run_id__in=user_visible_run_ids(user))
@@ -1,15 +1,68 @@
 """
 Веб-интерфейс для просмотра CI/CD отчётов.
 """
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.db.models import Count, Q, Avg
+from django.db.models.functions import TruncHour
 from django.utils import timezone
 from datetime import timedelta
 
 from .models import Run, TestCase, Defect
 
+# Количество CI/CD сборок на странице дашборда
+DASHBOARD_JOBS_PER_PAGE = 50
+
+# Пагинация cicd_status_api (?limit=&offset=)
+STATUS_API_DEFAULT_LIMIT = 100
+STATUS_API_MAX_LIMIT = 500
+
+# Временной ряд прогонов по часам (cicd_timeline_api)
+TIMELINE_MAX_DAYS = 90
+TIMELINE_CACHE_PREFIX = 'cicd:timeline:'
+# Статус прогона может смениться уже после окончания часа (processing -> finished),
+# поэтому закрытые часы кэшируются на ограниченное время, а не навсегда.
+TIMELINE_CACHE_TIMEOUT = 600
+
+
+def _parse_non_negative_int(value, default):
+    """Разбирает неотрицательное целое из query-параметра, при ошибке возвращает default."""
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        return default
+    return parsed if parsed >= 0 else default
+
+
+def _page_url(request, offset, limit):
+    """Строит абсолютный URL страницы с заданными offset/limit."""
+    query = request.GET.copy()
+    query['offset'] = offset
+    query['limit'] = limit
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def _hourly_status_counts(start, end=None):
+    """
+    Количество прогонов по часам и статусам в интервале [start, end).
+    Группировка (TruncHour) выполняется в БД. Возвращает {час: {статус: количество}}.
+    """
+    runs = Run.objects.filter(ci_job_id__isnull=False, started_at__gte=start)
+    if end is not None:
+        runs = runs.filter(started_at__lt=end)
+    
+    rows = runs.annotate(
+        hour=TruncHour('started_at')
+    ).values('hour', 'status').annotate(count=Count('id')).order_by()
+    
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(row['hour'], {})[row['status']] = row['count']
+    return buckets
+
 
 @login_required
 def cicd_dashboard(request):
@@ -30,21 +83,30 @@ def cicd_dashboard(request):
     if status:
         runs = runs.filter(status=status)
     
-    # Группируем по ci_job_id
-    ci_jobs = runs.values('ci_job_id').annotate(
+    # Группируем по ci_job_id. В контекст попадает только текущая страница сборок
+    # (LIMIT/OFFSET в SQL), поэтому память и время рендера не растут с числом сборок.
+    ci_jobs_qs = runs.values('ci_job_id').annotate(
         total_runs=Count('id'),
         finished_runs=Count('id', filter=Q(status='finished')),
         failed_runs=Count('id', filter=Q(status='failed')),
         processing_runs=Count('id', filter=Q(status='processing')),
         avg_coverage=Avg('coverage_metric__coverage_percent'),
         defect_count=Count('defects')
-    ).order_by('-total_runs')
+    ).order_by('-total_runs', 'ci_job_id')
+    paginator = Paginator(ci_jobs_qs, DASHBOARD_JOBS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    ci_jobs = list(page_obj.object_list)
     
-    # Общая статистика
-    total_jobs = ci_jobs.count()
-    total_runs_count = runs.count()
-    finished_count = runs.filter(status='finished').count()
-    failed_count = runs.filter(status='failed').count()
+    # Общая статистика одним запросом
+    totals = runs.aggregate(
+        total=Count('id'),
+        finished=Count('id', filter=Q(status='finished')),
+        failed=Count('id', filter=Q(status='failed')),
+    )
+    total_jobs = paginator.count
+    total_runs_count = totals['total']
+    finished_count = totals['finished']
+    failed_count = totals['failed']
     
     success_rate = 0
     if total_runs_count > 0:
@@ -52,6 +114,7 @@ def cicd_dashboard(request):
     
     context = {
         'ci_jobs': ci_jobs,
+        'page_obj': page_obj,
         'total_jobs': total_jobs,
         'total_runs': total_runs_count,
         'finished_runs': finished_count,
@@ -95,11 +158,13 @@ def cicd_job_detail(request, job_id):
         coverage_metric__isnull=False
     ).aggregate(Avg('coverage_metric__coverage_percent'))['coverage_metric__coverage_percent__avg']
     
-    # Дефекты
-    total_defects = Defect.objects.filter(run__in=runs).count()
-    critical_defects = Defect.objects.filter(
-        run__in=runs, severity='critical'
-    ).count()
+    # Дефекты: прямой фильтр по run__ci_job_id и один агрегат вместо двух IN (subselect)
+    defect_stats = Defect.objects.filter(run__ci_job_id=job_id).aggregate(
+        total=Count('id'),
+        critical=Count('id', filter=Q(severity='critical')),
+    )
+    total_defects = defect_stats['total']
+    critical_defects = defect_stats['critical']
     
     # Success rate
     success_rate = 0
@@ -137,16 +202,25 @@ def cicd_status_api(request):
     
     runs = Run.objects.filter(ci_job_id=job_id).select_related(
         'testcase', 'coverage_metric'
-    ).prefetch_related('defects')
+    ).prefetch_related('defects').order_by('-started_at')
     
     if not runs.exists():
         return JsonResponse({
             'error': f'No runs found for CI job {job_id}'
         }, status=404)
     
-    # Формируем ответ
+    limit = min(
+        _parse_non_negative_int(request.GET.get('limit'), STATUS_API_DEFAULT_LIMIT),
+        STATUS_API_MAX_LIMIT,
+    ) or STATUS_API_DEFAULT_LIMIT
+    offset = _parse_non_negative_int(request.GET.get('offset'), 0)
+    
+    # Формируем ответ (LIMIT/OFFSET выполняются в SQL)
     runs_data = []
-    for run in runs:
+    for run in runs[offset:offset + limit]:
+        # coverage_metric уже подтянут select_related; getattr с default не делает
+        # повторного обращения к дескриптору и не порождает SELECT при отсутствии метрики
+        coverage_metric = getattr(run, 'coverage_metric', None)
         runs_data.append({
             'id': run.id,
             'testcase_id': run.testcase.id,
@@ -154,7 +228,7 @@ def cicd_status_api(request):
             'status': run.status,
             'started_at': run.started_at.isoformat() if run.started_at else None,
             'finished_at': run.finished_at.isoformat() if run.finished_at else None,
-            'coverage': run.coverage_metric.coverage_percent if hasattr(run, 'coverage_metric') and run.coverage_metric else None,
+            'coverage': coverage_metric.coverage_percent if coverage_metric else None,
             'defects_count': run.defects.count(),
             'reference_diff_score': run.reference_diff_score,
         })
@@ -163,6 +237,9 @@ def cicd_status_api(request):
     finished_runs = runs.filter(status='finished').count()
     failed_runs = runs.filter(status='failed').count()
     
+    next_url = _page_url(request, offset + limit, limit) if offset + limit < total_runs else None
+    previous_url = _page_url(request, max(0, offset - limit), limit) if offset > 0 else None
+    
     # Определяем общий статус сборки
     if failed_runs > 0:
         overall_status = 'failed'
@@ -179,4 +256,43 @@ def cicd_status_api(request):
         'failed_runs': failed_runs,
         'success_rate': round((finished_runs / total_runs) * 100, 2) if total_runs > 0 else 0,
         'runs': runs_data,
+        'next': next_url,
+        'previous': previous_url,
+    })
+
+
+@login_required
+def cicd_timeline_api(request):
+    """
+    API endpoint с временным рядом прогонов CI/CD по часам и статусам.
+    
+    Агрегаты закрытых часов берутся из кэша; из БД заново читаются только
+    часы без кэша и текущий (незавершённый) час.
+    """
+    days = min(_parse_non_negative_int(request.GET.get('days'), 7), TIMELINE_MAX_DAYS) or 7
+    
+    now = timezone.localtime()
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    first_hour = current_hour - timedelta(days=days)
+    hours = [first_hour + timedelta(hours=i) for i in range(days * 24)]
+    keys = {hour: f'{TIMELINE_CACHE_PREFIX}{int(hour.timestamp())}' for hour in hours}
+    
+    cached = cache.get_many(keys.values())
+    missing = [hour for hour in hours if keys[hour] not in cached]
+    if missing:
+        fresh = _hourly_status_counts(missing[0], current_hour)
+        to_cache = {keys[hour]: fresh.get(hour, {}) for hour in missing}
+        cache.set_many(to_cache, TIMELINE_CACHE_TIMEOUT)
+        cached.update(to_cache)
+    
+    buckets = [
+        {'hour': hour.isoformat(), 'counts': cached[keys[hour]]}
+        for hour in hours
+    ]
+    live = _hourly_status_counts(current_hour)
+    buckets.append({'hour': current_hour.isoformat(), 'counts': live.get(current_hour, {})})
+    
+    return JsonResponse({
+        'days': days,
+        'buckets': buckets,
     })
@@ -9,26 +9,42 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth import login, logout
 from django.conf import settings
-import json
-import requests
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
 import os
+import tempfile
 
-from .models import TestCase, Run, UIElement, Defect, CoverageMetric
-from .tasks import generate_test_from_screenshot, compare_reference_with_actual
-from .cv_utils import load_image, analyze_elements_diff, compute_diff_mask, is_ocr_ready
+from .models import TestCase, Run, Defect, UIElement
+from .tasks import generate_test_from_screenshot, compare_reference_with_actual, delete_media_files
+from .cv_utils import is_ocr_ready
 from .task_runner import run_task_with_fallback
+from .visualization import discard_visualization, get_comparison_report, get_elements_visualization_url
 try:
-    from .ml_classifier import is_model_trained
+    from .ml_classifier import is_model_trained, clear_model_trained_cache
 except ImportError:
     # Если scikit-learn не установлен, используем заглушку
     def is_model_trained():
         return False
 
+    def clear_model_trained_cache():
+        pass
+
+from django.core.cache import cache
 from django.core.management import call_command
-from django.db.models import Count
+from django.db.models import Count, Prefetch
+
+try:
+    import orjson
+except ImportError:
+    # orjson опционален: без него ответы сериализует стандартный JsonResponse
+    orjson = None
+
+INDEX_COUNTS_CACHE_TIMEOUT = 30
+
+
+def _json_response(data, status=200):
+    """JSON-ответ через orjson, если он установлен, иначе через JsonResponse."""
+    if orjson is None:
+        return JsonResponse(data, status=status)
+    return HttpResponse(orjson.dumps(data), status=status, content_type='application/json')
 
 
 def login_view(request):
@@ -60,10 +76,15 @@ def logout_view(request):
 @login_required
 def index(request):
     """Главная страница с дашбордом."""
-    testcases_count = TestCase.objects.count()
-    runs_count = Run.objects.count()
-    recent_testcases = TestCase.objects.all().order_by('-created_at')[:5]
-    recent_runs = Run.objects.all().order_by('-started_at')[:5]
+    # Общие счетчики меняются медленно — кэшируем на INDEX_COUNTS_CACHE_TIMEOUT секунд
+    testcases_count = cache.get_or_set('index:testcases_count', TestCase.objects.count, INDEX_COUNTS_CACHE_TIMEOUT)
+    runs_count = cache.get_or_set('index:runs_count', Run.objects.count, INDEX_COUNTS_CACHE_TIMEOUT)
+    recent_testcases = TestCase.objects.only('id', 'title', 'status', 'created_at').annotate(
+        elements_count=Count('elements'),
+    ).order_by('-created_at')[:5]
+    recent_runs = Run.objects.select_related('testcase').only(
+        'id', 'status', 'coverage', 'started_at', 'testcase__id', 'testcase__title',
+    ).order_by('-started_at')[:5]
     
     context = {
         'testcases_count': testcases_count,
@@ -86,6 +107,8 @@ def train_ml_model(request):
     try:
         sys.stdout = buffer
         call_command('train_ml_model', force=True, verbosity=1)
+        # Статус модели изменился — сбрасываем кэш, чтобы страницы сразу показали актуальный
+        clear_model_trained_cache()
         output = buffer.getvalue().lower()
         
         if 'успешно обучена' in output or 'successfully' in output:
@@ -103,7 +126,12 @@ def train_ml_model(request):
 @login_required
 def testcases_list(request):
     """Список всех тест-кейсов."""
-    testcases = TestCase.objects.all().order_by('-created_at')
+    # Количество элементов и прогонов считается в том же запросе (distinct: два JOIN)
+    # Из тест-кейса выбираются только колонки, которые выводит таблица
+    testcases = TestCase.objects.only('id', 'title', 'status', 'created_at').annotate(
+        elements_count=Count('elements', distinct=True),
+        runs_count=Count('runs', distinct=True),
+    ).order_by('-created_at')
     context = {
         'testcases': testcases,
     }
@@ -113,8 +141,13 @@ def testcases_list(request):
 @login_required
 def runs_list(request):
     """Список всех прогонов."""
-    runs = Run.objects.select_related('testcase').all().order_by('-started_at')
-    testcases = TestCase.objects.all().order_by('-created_at')
+    # Только колонки, которые выводят таблица прогонов и список тест-кейсов в форме
+    runs = Run.objects.select_related('testcase').only(
+        'id', 'status', 'coverage', 'started_at', 'testcase__id', 'testcase__title',
+    ).prefetch_related(
+        Prefetch('defects', queryset=Defect.objects.only('id', 'run_id')),
+    ).order_by('-started_at')
+    testcases = TestCase.objects.only('id', 'title', 'status').order_by('-created_at')
     context = {
         'runs': runs,
         'testcases': testcases,
@@ -218,8 +251,7 @@ def create_run(request):
 
         task_result = run_task_with_fallback(compare_reference_with_actual, run.id)
         if task_result.is_async:
-            run.status = 'processing'
-            run.save(update_fields=['status'])
+            run.mark_processing()
             messages.success(
                 request,
                 f'Прогон создан! Сравнение выполняется в фоне (Task ID: {task_result.task_id}).',
@@ -267,8 +299,7 @@ def compare_run(request, run_id):
                 return redirect('run_detail', run_id=run_id)
         task_result = run_task_with_fallback(compare_reference_with_actual, run.id)
         if task_result.is_async:
-            run.status = 'processing'
-            run.save(update_fields=['status'])
+            run.mark_processing()
             messages.success(
                 request,
                 f'Сравнение запущено! Task ID: {task_result.task_id}. Обновите страницу через несколько секунд.',
@@ -287,6 +318,19 @@ def compare_run(request, run_id):
     return redirect('run_detail', run_id=run_id)
 
 
+def _schedule_media_cleanup(paths):
+    """Удаляет файлы в фоновой задаче, чтобы запрос не ждал файловое хранилище."""
+    paths = [path for path in paths if path]
+    if not paths:
+        return
+    try:
+        run_task_with_fallback(delete_media_files, paths)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.warning(f"Failed to schedule media cleanup for {len(paths)} files: {e}")
+
+
 @login_required
 @require_http_methods(["POST"])
 def delete_testcase(request, testcase_id):
@@ -302,16 +346,14 @@ def delete_testcase(request, testcase_id):
                 messages.error(request, 'У вас нет прав для удаления этого тест-кейса. Вы можете удалять только свои тест-кейсы.')
                 return redirect('testcase_detail', testcase_id=testcase_id)
         
-        # Удаляем связанные файлы (скриншоты)
-        if testcase.reference_screenshot:
-            try:
-                testcase.reference_screenshot.delete(save=False)
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to delete screenshot for testcase {testcase_id}: {e}")
+        # Запоминаем файлы тест-кейса и его прогонов до каскадного удаления записей
+        paths = [testcase.reference_screenshot.name, testcase.elements_vis_path]
+        for actual_screenshot, comparison_vis_path in testcase.runs.values_list('actual_screenshot', 'comparison_vis_path'):
+            paths.extend([actual_screenshot, comparison_vis_path])
+        paths.extend(testcase.defects.values_list('screenshot', flat=True))
         
         testcase.delete()
+        _schedule_media_cleanup(paths)
         messages.success(request, f'Тест-кейс "{testcase_title}" успешно удален.')
     except TestCase.DoesNotExist:
         messages.error(request, 'Тест-кейс не найден!')
@@ -346,16 +388,12 @@ def delete_run(request, run_id):
                 messages.error(request, 'У вас нет прав для удаления этого прогона. Вы можете удалять только свои прогоны или прогоны своих тест-кейсов.')
                 return redirect('run_detail', run_id=run_id)
         
-        # Удаляем связанные файлы (скриншоты)
-        if run.actual_screenshot:
-            try:
-                run.actual_screenshot.delete(save=False)
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to delete screenshot for run {run_id}: {e}")
+        # Запоминаем файлы прогона до удаления записей
+        paths = [run.actual_screenshot.name, run.comparison_vis_path]
+        paths.extend(run.defects.values_list('screenshot', flat=True))
         
         run.delete()
+        _schedule_media_cleanup(paths)
         messages.success(request, f'Прогон #{run_id_str} успешно удален.')
     except Run.DoesNotExist:
         messages.error(request, 'Прогон не найден!')
@@ -370,15 +408,17 @@ def testcase_detail(request, testcase_id):
     """Детальная информация о тест-кейсе."""
     try:
         testcase = TestCase.objects.prefetch_related('elements', 'defects', 'runs').get(pk=testcase_id)
+        # Элементы уже загружены prefetch_related — дальше используем только этот кэш
+        elements = testcase.elements.all()
         
-        # Создаем визуализацию с подсветкой элементов
+        # Визуализация строится при анализе (в задаче); здесь перестраивается, только если файла нет
         visualization_url = None
-        if testcase.reference_screenshot and testcase.elements.exists():
-            visualization_url = create_elements_visualization(testcase)
+        if testcase.reference_screenshot and elements:
+            visualization_url = get_elements_visualization_url(testcase, elements)
         
         context = {
             'testcase': testcase,
-            'elements': testcase.elements.all(),
+            'elements': elements,
             'runs': testcase.runs.all().order_by('-started_at'),
             'visualization_url': visualization_url,
             'ocr_ready': is_ocr_ready(),
@@ -395,10 +435,10 @@ def run_detail(request, run_id):
     try:
         run = Run.objects.select_related('testcase', 'coverage_metric').prefetch_related('defects', 'testcase__elements').get(pk=run_id)
         
-        # Создаем отчет сравнения с визуализацией
+        # Отчет сравнения собирается из результатов задачи; изображения обрабатываются, только если визуализации нет
         comparison_report = None
         if run.status == 'finished' and run.testcase.reference_screenshot and run.actual_screenshot:
-            comparison_report = create_comparison_report(run)
+            comparison_report = get_comparison_report(run)
         
         # Получаем URL Jira задачи, если есть
         jira_issue_url = None
@@ -419,222 +459,6 @@ def run_detail(request, run_id):
         return redirect('runs_list')
 
 
-def create_elements_visualization(testcase):
-    """Создает визуализацию с подсветкой элементов на скриншоте."""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    try:
-        if not testcase.reference_screenshot:
-            logger.warning(f"Testcase {testcase.id} has no reference screenshot")
-            return None
-        
-        img_path = testcase.reference_screenshot.path
-        if not os.path.exists(img_path):
-            logger.warning(f"Screenshot file not found: {img_path}")
-            return None
-        
-        # Проверяем, есть ли элементы
-        elements_count = testcase.elements.count()
-        if elements_count == 0:
-            logger.warning(f"Testcase {testcase.id} has no elements to visualize")
-            return None
-        
-        logger.info(f"Creating visualization for testcase {testcase.id} with {elements_count} elements")
-        
-        # Загружаем изображение
-        img = cv2.imread(img_path)
-        if img is None:
-            logger.error(f"Failed to load image: {img_path}")
-            return None
-        
-        h, w = img.shape[:2]
-        logger.info(f"Image size: {w}x{h}")
-        
-        # Создаем копию для рисования
-        vis_img = img.copy()
-        
-        # Цвета для разных типов элементов (BGR формат для OpenCV)
-        colors = {
-            'button': (0, 255, 0),      # Зеленый
-            'input': (255, 0, 0),       # Синий
-            'label': (0, 0, 255),       # Красный
-            'image': (0, 255, 255),     # Желтый
-            'link': (255, 0, 255),      # Пурпурный
-            'unknown': (128, 128, 128), # Серый
-        }
-        
-        # Рисуем рамки для каждого элемента
-        drawn_count = 0
-        for element in testcase.elements.all():
-            try:
-                bbox = element.bbox
-                if not bbox or 'x' not in bbox:
-                    logger.warning(f"Element {element.id} has invalid bbox: {bbox}")
-                    continue
-                
-                x = int(bbox['x'] * w)
-                y = int(bbox['y'] * h)
-                width = int(bbox['w'] * w)
-                height = int(bbox['h'] * h)
-                
-                # Проверяем границы
-                if x < 0 or y < 0 or x + width > w or y + height > h:
-                    logger.warning(f"Element {element.id} bbox out of bounds: x={x}, y={y}, w={width}, h={height}, img={w}x{h}")
-                    continue
-                
-                if width <= 0 or height <= 0:
-                    logger.warning(f"Element {element.id} has invalid size: {width}x{height}")
-                    continue
-                
-                color = colors.get(element.element_type or 'unknown', colors['unknown'])
-                
-                # Рисуем прямоугольник (толщина 3 для лучшей видимости)
-                cv2.rectangle(vis_img, (x, y), (x + width, y + height), color, 3)
-                
-                # Добавляем текст с типом элемента
-                label = f"{element.element_type or 'unknown'} #{element.id}"
-                if element.name:
-                    label = f"{element.name[:20]} - {label}"
-                
-                # Фон для текста
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                font_scale = 0.6
-                thickness = 2
-                (text_width, text_height), baseline = cv2.getTextSize(label, font, font_scale, thickness)
-                
-                # Рисуем фон для текста
-                cv2.rectangle(vis_img, (x, y - text_height - 10), (x + text_width + 5, y), color, -1)
-                cv2.putText(vis_img, label, (x + 2, y - 5), font, font_scale, (255, 255, 255), thickness)
-                
-                drawn_count += 1
-            except Exception as e:
-                logger.error(f"Error drawing element {element.id}: {e}")
-                continue
-        
-        logger.info(f"Drawn {drawn_count} elements on visualization")
-        
-        # Сохраняем визуализацию в правильную папку
-        vis_dir = os.path.join(settings.MEDIA_ROOT, 'visualizations')
-        os.makedirs(vis_dir, exist_ok=True)
-        vis_filename = f'testcase_{testcase.id}_elements.png'
-        vis_path = os.path.join(vis_dir, vis_filename)
-        
-        # Сохраняем изображение
-        success = cv2.imwrite(vis_path, vis_img)
-        if not success:
-            logger.error(f"Failed to save visualization to {vis_path}")
-            return None
-        
-        logger.info(f"Visualization saved to {vis_path}")
-        
-        # Возвращаем относительный URL
-        return f'{settings.MEDIA_URL}visualizations/{vis_filename}'
-    except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Error creating visualization: {e}", exc_info=True)
-        return None
-
-
-def create_comparison_report(run):
-    """Создает отчет сравнения с визуализацией различий."""
-    try:
-        testcase = run.testcase
-        if not testcase.reference_screenshot or not run.actual_screenshot:
-            return None
-        
-        ref_path = testcase.reference_screenshot.path
-        actual_path = run.actual_screenshot.path
-        
-        if not os.path.exists(ref_path) or not os.path.exists(actual_path):
-            return None
-        
-        ref_img = load_image(ref_path)
-        actual_img = load_image(actual_path)
-        
-        if ref_img is None or actual_img is None:
-            return None
-        
-        h, w = ref_img.shape[:2]
-        actual_resized = cv2.resize(actual_img, (w, h))
-        aligned_actual, diff_mask, ssim_score = compute_diff_mask(
-            ref_img,
-            actual_resized,
-            diff_threshold=getattr(settings, 'CV_DIFF_TOLERANCE', 0.12),
-        )
-        
-        contours, _ = cv2.findContours(diff_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        vis_img = ref_img.copy()
-        cv2.drawContours(vis_img, contours, -1, (0, 0, 255), 2)
-        
-        analysis = analyze_elements_diff(
-            testcase,
-            diff_mask,
-            missing_threshold=min(0.95, getattr(settings, 'CV_DIFF_TOLERANCE', 0.12) + 0.45),
-            changed_threshold=max(0.15, getattr(settings, 'CV_ELEMENT_DIFF_RATIO', 0.12)),
-            min_ratio=getattr(settings, 'CV_ELEMENT_DIFF_RATIO', 0.12),
-            max_shift_px=getattr(settings, 'CV_ELEMENT_SHIFT_PX', 18),
-        )
-        color_map = {
-            'missing': (0, 0, 255),       # Red
-            'shifted': (0, 165, 255),     # Orange
-            'ok': (0, 200, 0),            # Green
-        }
-
-        for item in analysis['elements']:
-            bbox = item['bbox']
-            x = int(bbox.get('x', 0) * w)
-            y = int(bbox.get('y', 0) * h)
-            width = int(bbox.get('w', 0) * w)
-            height = int(bbox.get('h', 0) * h)
-
-            color = color_map.get(item['status'], (200, 200, 200))
-            thickness = 3 if item['status'] != 'ok' else 1
-            cv2.rectangle(vis_img, (x, y), (x + width, y + height), color, thickness)
-            if item['status'] != 'ok':
-                label = f"{item['status'].upper()} #{item['id']}"
-                cv2.putText(
-                    vis_img,
-                    label,
-                    (x, max(20, y - 10)),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    color,
-                    2,
-                )
-        
-        # Сохраняем визуализацию в правильную папку
-        vis_dir = os.path.join(settings.MEDIA_ROOT, 'visualizations')
-        os.makedirs(vis_dir, exist_ok=True)
-        vis_filename = f'run_{run.id}_comparison.png'
-        vis_path = os.path.join(vis_dir, vis_filename)
-        
-        # Сохраняем изображение
-        success = cv2.imwrite(vis_path, vis_img)
-        if not success:
-            logger.error(f"Failed to save comparison visualization to {vis_path}")
-            return None
-        
-        missing_elements = [elem for elem in analysis['elements'] if elem['status'] == 'missing']
-        shifted_elements = [elem for elem in analysis['elements'] if elem['status'] == 'shifted']
-
-        return {
-            'visualization_url': f'{settings.MEDIA_URL}visualizations/{vis_filename}',
-            'analysis': analysis,
-            'missing_elements': missing_elements,
-            'shifted_elements': shifted_elements,
-            'reference_url': testcase.reference_screenshot.url,
-            'actual_url': run.actual_screenshot.url if run.actual_screenshot else None,
-            'ssim_score': ssim_score,
-        }
-    except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Error creating comparison report: {e}")
-        return None
-
-
 def _update_env_file(jira_url, jira_username, jira_api_token, jira_project_key):
     """Обновляет или создает .env файл с настройками Jira."""
     env_path = settings.BASE_DIR.parent / '.env'
@@ -663,10 +487,9 @@ def _update_env_file(jira_url, jira_username, jira_api_token, jira_project_key):
         'JIRA_PROJECT_KEY': jira_project_key,
     }
     
-    # Удаляем старые настройки Jira
-    env_lines = [line for line in env_lines if not any(
-        line.strip().startswith(f'{key}=') for key in jira_settings.keys()
-    )]
+    # Удаляем старые настройки Jira (ключ строки проверяем по множеству)
+    jira_keys = set(jira_settings)
+    env_lines = [line for line in env_lines if line.split('=', 1)[0].strip() not in jira_keys]
     
     # Добавляем новые настройки
     if env_lines and not env_lines[-1].endswith('\n'):
@@ -681,9 +504,19 @@ def _update_env_file(jira_url, jira_username, jira_api_token, jira_project_key):
         if value:  # Только если значение не пустое
             env_lines.append(f'{key}={value}\n')
     
-    # Записываем обратно
-    with open(env_path, 'w', encoding='utf-8') as f:
-        f.writelines(env_lines)
+    # Записываем во временный файл рядом и атомарно подменяем .env,
+    # чтобы параллельный читатель не увидел наполовину записанный файл
+    fd, tmp_path = tempfile.mkstemp(dir=env_path.parent, prefix='.env.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.writelines(env_lines)
+        if env_path.exists():
+            os.chmod(tmp_path, os.stat(env_path).st_mode & 0o777)
+        os.replace(tmp_path, env_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
     
     return env_path
 
@@ -691,7 +524,7 @@ def _update_env_file(jira_url, jira_username, jira_api_token, jira_project_key):
 @login_required
 def jira_settings(request):
     """Страница настроек Jira."""
-    from .jira_integration import get_jira_client, JIRA_AVAILABLE
+    from .jira_integration import get_jira_client, clear_jira_client_cache, JIRA_AVAILABLE
     
     # Получаем текущие настройки
     current_settings = {
@@ -731,6 +564,7 @@ def jira_settings(request):
             
             try:
                 env_path = _update_env_file(jira_url, jira_username, jira_api_token, jira_project_key)
+                clear_jira_client_cache()
                 save_success = True
                 messages.success(request, f'Настройки сохранены в файл {env_path}. Перезапустите Django сервер для применения изменений.')
                 
@@ -780,10 +614,10 @@ def jira_settings(request):
 @login_required
 def test_jira_connection(request):
     """API endpoint для проверки подключения к Jira."""
-    from .jira_integration import get_jira_client, JIRA_AVAILABLE
+    from .jira_integration import JIRA_AVAILABLE, evict_jira_test_client, get_jira_test_client
     
     if request.method != 'POST':
-        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+        return _json_response({'error': 'Only POST method allowed'}, status=405)
     
     jira_url = request.POST.get('jira_url', '').strip()
     jira_username = request.POST.get('jira_username', '').strip()
@@ -791,26 +625,27 @@ def test_jira_connection(request):
     jira_project_key = request.POST.get('jira_project_key', '').strip()
     
     if not all([jira_url, jira_username, jira_api_token]):
-        return JsonResponse({
+        return _json_response({
             'success': False,
             'error': 'Заполните все обязательные поля'
         })
     
     if not JIRA_AVAILABLE:
-        return JsonResponse({
+        return _json_response({
             'success': False,
             'error': 'Библиотека jira-python не установлена. Установите: pip install jira'
         })
     
     try:
-        from jira import JIRA
-        jira = JIRA(
-            server=jira_url,
-            basic_auth=(jira_username, jira_api_token)
-        )
+        jira = get_jira_test_client(jira_url, jira_username, jira_api_token)
         
         # Проверяем подключение
-        user = jira.current_user()
+        try:
+            user = jira.current_user()
+        except Exception:
+            # Закэшированный клиент больше не работает — следующая проверка подключится заново
+            evict_jira_test_client(jira_url, jira_username, jira_api_token)
+            raise
         
         # Проверяем доступ к проекту, если указан
         project_info = None
@@ -822,19 +657,19 @@ def test_jira_connection(request):
                     'name': project.name,
                 }
             except Exception as e:
-                return JsonResponse({
+                return _json_response({
                     'success': False,
                     'error': f'Проект {jira_project_key} не найден или нет доступа: {e}'
                 })
         
-        return JsonResponse({
+        return _json_response({
             'success': True,
             'user': user,
             'project': project_info,
             'message': 'Подключение успешно!'
         })
     except Exception as e:
-        return JsonResponse({
+        return _json_response({
             'success': False,
             'error': str(e)
         })
@@ -845,70 +680,88 @@ def test_jira_connection(request):
 def approve_elements(request, testcase_id):
     """Сохранение отмеченных элементов и переклассификация остальных."""
     import json
-    from django.http import JsonResponse
     
     try:
-        testcase = TestCase.objects.get(pk=testcase_id)
+        testcase = TestCase.objects.only(
+            'id', 'created_by_id', 'reference_screenshot', 'elements_vis_path'
+        ).get(pk=testcase_id)
         
-        # Проверяем права доступа
-        if testcase.created_by and testcase.created_by != request.user and not request.user.is_superuser:
-            return JsonResponse({'error': 'Нет прав для редактирования этого тест-кейса'}, status=403)
+        # Проверяем права доступа (по id, без загрузки пользователя)
+        if testcase.created_by_id and testcase.created_by_id != request.user.id and not request.user.is_superuser:
+            return _json_response({'error': 'Нет прав для редактирования этого тест-кейса'}, status=403)
         
         data = json.loads(request.body)
         approved_ids = data.get('approved_element_ids', [])
         
         if not approved_ids:
-            return JsonResponse({'error': 'Не указаны элементы для сохранения'}, status=400)
+            return _json_response({'error': 'Не указаны элементы для сохранения'}, status=400)
         
-        all_elements = testcase.elements.all()
-        approved_elements = all_elements.filter(id__in=approved_ids)
-        rejected_elements = all_elements.exclude(id__in=approved_ids)
+        # Один запрос за элементами, разбиение на одобренные/отклоненные — в Python
+        approved_set = {str(element_id) for element_id in approved_ids}
+        all_elements = list(testcase.elements.only('id', 'testcase', 'bbox', 'element_type', 'confidence'))
+        approved_elements = [elem for elem in all_elements if str(elem.id) in approved_set]
+        rejected_elements = [elem for elem in all_elements if str(elem.id) not in approved_set]
         
         # Переклассифицируем отклоненные элементы
         reclassified_count = 0
         img = None
         if testcase.reference_screenshot:
-            from .cv_utils import load_image, classify_element_type
-            img = load_image(testcase.reference_screenshot.path)
+            from .cv_utils import load_image_cached, classify_element_types_batch
+            img = load_image_cached(testcase.reference_screenshot.path)
         
-        if img is not None:
+        if img is not None and rejected_elements:
+            import numpy as np
+            
             h, w = img.shape[:2]
-            for elem in rejected_elements:
-                # Пробуем переклассифицировать
-                new_type, new_conf = classify_element_type(img, elem.bbox, w, h)
-                
-                # Если элемент unknown, но имеет признаки текста - классифицируем как label
-                if new_type == 'unknown':
-                    # Проверяем признаки текста
-                    bbox = elem.bbox
-                    aspect_ratio = bbox['w'] / max(bbox['h'], 0.001)
-                    if aspect_ratio > 1.5:
-                        new_type = 'label'
-                        new_conf = 0.6
-                
+            bboxes = [elem.bbox for elem in rejected_elements]
+            # Классифицируем все отклоненные элементы за один проход по изображению
+            predictions = classify_element_types_batch(img, bboxes, w, h)
+            new_types = np.array([new_type for new_type, _ in predictions], dtype=object)
+            new_confs = np.array([new_conf for _, new_conf in predictions], dtype=np.float64)
+            
+            # Если элемент unknown, но имеет признаки текста (вытянут по горизонтали) - классифицируем как label
+            widths = np.array([bbox['w'] for bbox in bboxes], dtype=np.float64)
+            heights = np.array([bbox['h'] for bbox in bboxes], dtype=np.float64)
+            aspect_ratios = widths / np.maximum(heights, 0.001)
+            promote = (new_types == 'unknown') & (aspect_ratios > 1.5)
+            new_types[promote] = 'label'
+            new_confs[promote] = 0.6
+            
+            changed = []
+            for elem, new_type, new_conf in zip(rejected_elements, new_types.tolist(), new_confs.tolist()):
                 if new_type != elem.element_type:
                     elem.element_type = new_type
                     elem.confidence = new_conf
-                    elem.save(update_fields=['element_type', 'confidence'])
-                    reclassified_count += 1
+                    changed.append(elem)
+            
+            if changed:
+                UIElement.objects.bulk_update(changed, ['element_type', 'confidence'], batch_size=500)
+            reclassified_count = len(changed)
+        
+        # Типы элементов изменились — визуализация перестроится при следующем просмотре
+        if reclassified_count and testcase.elements_vis_path:
+            discard_visualization(testcase.elements_vis_path)
+            testcase.elements_vis_path = ''
+            testcase.save(update_fields=['elements_vis_path'])
         
         # Сохраняем информацию об одобренных элементах для дообучения
         # Можно добавить в metadata или отдельную модель
-        retrain_available = approved_elements.count() >= 10  # Минимум 10 элементов для дообучения
+        approved_count = len(approved_elements)
+        retrain_available = approved_count >= 10  # Минимум 10 элементов для дообучения
         
-        return JsonResponse({
+        return _json_response({
             'success': True,
-            'approved_count': approved_elements.count(),
+            'approved_count': approved_count,
             'reclassified': reclassified_count,
             'retrain_available': retrain_available,
-            'message': f'Сохранено {approved_elements.count()} элементов'
+            'message': f'Сохранено {approved_count} элементов'
         })
         
     except TestCase.DoesNotExist:
-        return JsonResponse({'error': 'Тест-кейс не найден'}, status=404)
+        return _json_response({'error': 'Тест-кейс не найден'}, status=404)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
         logger.error(f"Error approving elements: {e}", exc_info=True)
-        return JsonResponse({'error': str(e)}, status=500)
+        return _json_response({'error': str(e)}, status=500)
 
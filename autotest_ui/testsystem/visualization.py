@@ -0,0 +1,440 @@
+"""
+Визуализация результатов анализа: подсветка элементов на эталоне и отчет сравнения прогона.
+
+Изображения строятся в Celery-задачах (generate_test_from_screenshot,
+compare_reference_with_actual) и сохраняются в MEDIA_ROOT/visualizations,
+путь к файлу хранится в модели. Детальные страницы только отдают готовый файл
+и перестраивают его, если файла нет или он старше исходных скриншотов.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from .cv_utils import load_image, analyze_elements_diff, compute_diff_mask, resize_to_reference
+
+logger = logging.getLogger(__name__)
+
+VISUALIZATIONS_DIR = 'visualizations'
+
+# Максимальная ширина визуализации: рисуем и кодируем уменьшенную копию скриншота
+VISUALIZATION_MAX_WIDTH = getattr(settings, 'VISUALIZATION_MAX_WIDTH', 1280)
+
+# Визуализации сохраняются в JPEG: скриншот с рамками кодируется быстрее и весит в разы меньше PNG
+VISUALIZATION_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+# Цвета для разных типов элементов (BGR формат для OpenCV): строка таблицы = индекс типа
+ELEMENT_TYPES = ('button', 'input', 'label', 'image', 'link', 'unknown')
+ELEMENT_TYPE_IDS = {element_type: i for i, element_type in enumerate(ELEMENT_TYPES)}
+UNKNOWN_TYPE_ID = ELEMENT_TYPE_IDS['unknown']
+ELEMENT_COLORS = np.array([
+    (0, 255, 0),      # button — зеленый
+    (255, 0, 0),      # input — синий
+    (0, 0, 255),      # label — красный
+    (0, 255, 255),    # image — желтый
+    (255, 0, 255),    # link — пурпурный
+    (128, 128, 128),  # unknown — серый
+], dtype=np.uint8)
+
+# Области различий ищутся на маске, уменьшенной в DIFF_REGION_DOWNSAMPLE раз;
+# компоненты меньше DIFF_REGION_MIN_AREA пикселей (после уменьшения) не рисуются
+DIFF_REGION_DOWNSAMPLE = 4
+DIFF_REGION_MIN_AREA = 2
+
+# Цвета статусов элементов в отчете сравнения (BGR)
+COMPARISON_COLORS = {
+    'missing': (0, 0, 255),       # Red
+    'shifted': (0, 165, 255),     # Orange
+    'ok': (0, 200, 0),            # Green
+}
+
+
+# Шрифт подписей элементов
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_FONT_SCALE = 0.6
+LABEL_THICKNESS = 2
+
+
+@lru_cache(maxsize=4096)
+def _label_size(label):
+    """Размер подписи (ширина, высота) в пикселях; подписи повторяются между перерисовками."""
+    (text_width, text_height), _baseline = cv2.getTextSize(label, LABEL_FONT, LABEL_FONT_SCALE, LABEL_THICKNESS)
+    return text_width, text_height
+
+
+def _save_visualization(vis_img, prefix, previous_path=''):
+    """
+    Сохраняет изображение в MEDIA_ROOT/visualizations под именем с хэшем содержимого
+    (prefix_<hash>.jpg): одинаковая картинка не перекодируется, а новый URL сбрасывает кэш браузера.
+    Предыдущий файл (previous_path) удаляется, если имя изменилось.
+    Возвращает путь относительно MEDIA_ROOT.
+    """
+    digest = hashlib.blake2b(vis_img.tobytes(), digest_size=8).hexdigest()
+    filename = f'{prefix}_{digest}.jpg'
+    rel_path = f'{VISUALIZATIONS_DIR}/{filename}'
+    vis_dir = os.path.join(settings.MEDIA_ROOT, VISUALIZATIONS_DIR)
+    vis_path = os.path.join(vis_dir, filename)
+
+    if os.path.exists(vis_path):
+        # Содержимое то же — только обновляем mtime, чтобы проверка актуальности не перестраивала его снова
+        os.utime(vis_path)
+        logger.info(f"Visualization {vis_path} is up to date")
+    else:
+        success, encoded = cv2.imencode('.jpg', vis_img, VISUALIZATION_JPEG_PARAMS)
+        if not success:
+            logger.error(f"Failed to encode visualization {vis_path}")
+            return None
+
+        # Пишем во временный файл и переименовываем: файл по итоговому имени всегда целый
+        os.makedirs(vis_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=vis_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(encoded.tobytes())
+            os.replace(tmp_path, vis_path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            logger.error(f"Failed to save visualization to {vis_path}: {e}")
+            return None
+        logger.info(f"Visualization saved to {vis_path}")
+
+    if previous_path and previous_path != rel_path:
+        discard_visualization(previous_path)
+    return rel_path
+
+
+def discard_visualization(rel_path):
+    """Удаляет сохраненную визуализацию (путь относительно MEDIA_ROOT), если она есть."""
+    if not rel_path:
+        return
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, rel_path))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to delete visualization {rel_path}: {e}")
+
+
+def _downscale(img, interpolation=cv2.INTER_AREA):
+    """Уменьшает изображение до VISUALIZATION_MAX_WIDTH по ширине; меньшие возвращаются как есть."""
+    h, w = img.shape[:2]
+    scale = min(1.0, VISUALIZATION_MAX_WIDTH / w)
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=interpolation)
+
+
+def _scale_bboxes(bboxes, w, h, missing=0):
+    """
+    Переводит нормализованные bbox ({x, y, w, h} в долях) в пиксели изображения w×h.
+    Отсутствующие координаты (и пустой bbox) заменяются на missing.
+    Возвращает массив int32 формы (N, 4): x, y, ширина, высота.
+    """
+    if not bboxes:
+        return np.empty((0, 4), dtype=np.int32)
+    coords = np.array(
+        [[(bbox or {}).get(key, missing) for key in ('x', 'y', 'w', 'h')] for bbox in bboxes],
+        dtype=np.float32,
+    )
+    return (coords * np.array([w, h, w, h], dtype=np.float32)).astype(np.int32)
+
+
+def visualization_url(rel_path, *source_paths):
+    """
+    URL сохраненной визуализации.
+    Возвращает None, если файла нет или он старше любого из исходных файлов
+    (например, эталон заменили) — тогда визуализацию нужно перестроить.
+    """
+    if not rel_path:
+        return None
+
+    try:
+        vis_mtime = os.path.getmtime(os.path.join(settings.MEDIA_ROOT, rel_path))
+    except OSError:
+        return None
+
+    for source_path in source_paths:
+        try:
+            if os.path.getmtime(source_path) > vis_mtime:
+                return None
+        except OSError:
+            continue
+
+    return f'{settings.MEDIA_URL}{rel_path}'
+
+
+def render_elements_visualization(testcase, img, elements):
+    """
+    Рисует рамки элементов на скриншоте и сохраняет результат.
+    img изменяется на месте, если не уменьшается, — передавайте изображение, которое больше не нужно.
+    Возвращает путь относительно MEDIA_ROOT или None при ошибке.
+    """
+    try:
+        logger.info(f"Creating visualization for testcase {testcase.id} with {len(elements)} elements, image size: {img.shape[1]}x{img.shape[0]}")
+
+        # Рисуем на уменьшенной копии (или прямо на img, если он не больше лимита);
+        # bbox нормализованы, поэтому масштабируются по размеру холста
+        vis_img = _downscale(img)
+        h, w = vis_img.shape[:2]
+
+        # Все bbox масштабируем одной операцией; отсутствующие координаты (-1) не пройдут проверку
+        boxes = _scale_bboxes([element.bbox for element in elements], w, h, missing=-1)
+        x, y, width, height = boxes.T
+        # Рамка должна быть ненулевой и целиком внутри изображения
+        valid = (width > 0) & (height > 0) & (x >= 0) & (y >= 0) & (x + width <= w) & (y + height <= h)
+        if not valid.all():
+            skipped = [elements[i].id for i in np.flatnonzero(~valid)]
+            logger.warning(f"Skipped {len(skipped)} elements with missing, empty or out of bounds bbox (img={w}x{h}): {skipped}")
+
+        # Цвета всех элементов выбираем одной индексацией таблицы по id типа
+        type_ids = np.fromiter(
+            (ELEMENT_TYPE_IDS.get(element.element_type, UNKNOWN_TYPE_ID) for element in elements),
+            dtype=np.int8,
+            count=len(elements),
+        )
+        colors = ELEMENT_COLORS[type_ids].tolist()
+
+        # В цикле остаются только вызовы отрисовки
+        drawn_count = 0
+        for i in np.flatnonzero(valid):
+            element = elements[i]
+            x, y, width, height = boxes[i].tolist()
+            try:
+                color = tuple(colors[i])
+
+                # Рисуем прямоугольник (толщина 3 для лучшей видимости)
+                cv2.rectangle(vis_img, (x, y), (x + width, y + height), color, 3)
+
+                # Добавляем текст с типом элемента
+                label = f"{element.element_type or 'unknown'} #{element.id}"
+                if element.name:
+                    label = f"{element.name[:20]} - {label}"
+
+                text_width, text_height = _label_size(label)
+
+                # Рисуем фон для текста
+                cv2.rectangle(vis_img, (x, y - text_height - 10), (x + text_width + 5, y), color, -1)
+                cv2.putText(vis_img, label, (x + 2, y - 5), LABEL_FONT, LABEL_FONT_SCALE, (255, 255, 255), LABEL_THICKNESS)
+
+                drawn_count += 1
+            except Exception as e:
+                logger.error(f"Error drawing element {element.id}: {e}")
+                continue
+
+        logger.info(f"Drawn {drawn_count} elements on visualization")
+
+        return _save_visualization(vis_img, f'testcase_{testcase.id}_elements', testcase.elements_vis_path)
+    except Exception as e:
+        logger.error(f"Error creating visualization: {e}", exc_info=True)
+        return None
+
+
+def create_elements_visualization(testcase, elements=None):
+    """
+    Создает визуализацию с подсветкой элементов на скриншоте и запоминает путь в testcase.
+    elements — уже загруженные элементы тест-кейса (если не переданы, читаются из БД).
+    Возвращает URL визуализации или None.
+    """
+    if not testcase.reference_screenshot:
+        logger.warning(f"Testcase {testcase.id} has no reference screenshot")
+        return None
+
+    img_path = testcase.reference_screenshot.path
+    if not os.path.exists(img_path):
+        logger.warning(f"Screenshot file not found: {img_path}")
+        return None
+
+    # Проверяем, есть ли элементы
+    if elements is None:
+        elements = testcase.elements.all()
+    elements = list(elements)
+    if not elements:
+        logger.warning(f"Testcase {testcase.id} has no elements to visualize")
+        return None
+
+    # Загружаем изображение
+    img = cv2.imread(img_path)
+    if img is None:
+        logger.error(f"Failed to load image: {img_path}")
+        return None
+
+    rel_path = render_elements_visualization(testcase, img, elements)
+    if rel_path is None:
+        return None
+
+    testcase.elements_vis_path = rel_path
+    testcase.save(update_fields=['elements_vis_path'])
+    return f'{settings.MEDIA_URL}{rel_path}'
+
+
+def get_elements_visualization_url(testcase, elements=None):
+    """
+    URL визуализации элементов тест-кейса: сохраненный файл, если он актуален,
+    иначе визуализация перестраивается.
+    """
+    url = visualization_url(testcase.elements_vis_path, testcase.reference_screenshot.path)
+    if url:
+        return url
+    return create_elements_visualization(testcase, elements)
+
+
+def _diff_regions(diff_mask, w, h):
+    """
+    Прямоугольники областей различий в координатах изображения w×h.
+    Маска уменьшается в DIFF_REGION_DOWNSAMPLE раз (INTER_AREA сохраняет тонкие линии),
+    области находятся одной разметкой связных компонент вместо поиска контуров.
+    """
+    mask_h, mask_w = diff_mask.shape[:2]
+    small_w = max(1, mask_w // DIFF_REGION_DOWNSAMPLE)
+    small_h = max(1, mask_h // DIFF_REGION_DOWNSAMPLE)
+    small = cv2.resize(diff_mask, (small_w, small_h), interpolation=cv2.INTER_AREA)
+    _, small = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY)
+
+    count, _labels, stats, _centroids = cv2.connectedComponentsWithStats(small, connectivity=8)
+    # Компонента 0 — фон
+    stats = stats[1:]
+    stats = stats[stats[:, cv2.CC_STAT_AREA] >= DIFF_REGION_MIN_AREA]
+
+    scale = np.array([w / small_w, h / small_h, w / small_w, h / small_h], dtype=np.float32)
+    return (stats[:, :4] * scale).astype(np.int32).tolist()
+
+
+def render_comparison_visualization(run, ref_img, diff_mask, analysis):
+    """
+    Рисует области различий и статусы элементов поверх эталона и сохраняет результат.
+    ref_img изменяется на месте, если не уменьшается.
+    analysis — результат analyze_elements_diff. Возвращает путь относительно MEDIA_ROOT или None.
+    """
+    try:
+        vis_img = _downscale(ref_img)
+        h, w = vis_img.shape[:2]
+
+        # Без различий (частый случай успешного прогона) области не ищем
+        if cv2.countNonZero(diff_mask):
+            for x, y, width, height in _diff_regions(diff_mask, w, h):
+                cv2.rectangle(vis_img, (x, y), (x + width, y + height), (0, 0, 255), 2)
+
+        items = analysis['elements']
+        boxes = _scale_bboxes([item['bbox'] for item in items], w, h)
+        for item, (x, y, width, height) in zip(items, boxes.tolist()):
+            color = COMPARISON_COLORS.get(item['status'], (200, 200, 200))
+            thickness = 3 if item['status'] != 'ok' else 1
+            cv2.rectangle(vis_img, (x, y), (x + width, y + height), color, thickness)
+            if item['status'] != 'ok':
+                label = f"{item['status'].upper()} #{item['id']}"
+                cv2.putText(
+                    vis_img,
+                    label,
+                    (x, max(20, y - 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6,
+                    color,
+                    2,
+                )
+
+        return _save_visualization(vis_img, f'run_{run.id}_comparison', run.comparison_vis_path)
+    except Exception as e:
+        logger.error(f"Error creating comparison visualization: {e}", exc_info=True)
+        return None
+
+
+def build_comparison_report(run, analysis, ssim_score, vis_url):
+    """Собирает словарь отчета сравнения для шаблона run_detail."""
+    missing_elements = [elem for elem in analysis['elements'] if elem['status'] == 'missing']
+    shifted_elements = [elem for elem in analysis['elements'] if elem['status'] == 'shifted']
+
+    return {
+        'visualization_url': vis_url,
+        'analysis': analysis,
+        'missing_elements': missing_elements,
+        'shifted_elements': shifted_elements,
+        'reference_url': run.testcase.reference_screenshot.url,
+        'actual_url': run.actual_screenshot.url if run.actual_screenshot else None,
+        'ssim_score': ssim_score,
+    }
+
+
+def create_comparison_report(run):
+    """
+    Полностью пересчитывает сравнение прогона, сохраняет визуализацию различий
+    и запоминает путь в run. Возвращает отчет или None.
+    """
+    try:
+        testcase = run.testcase
+        if not testcase.reference_screenshot or not run.actual_screenshot:
+            return None
+
+        ref_path = testcase.reference_screenshot.path
+        actual_path = run.actual_screenshot.path
+
+        if not os.path.exists(ref_path) or not os.path.exists(actual_path):
+            return None
+
+        ref_img = load_image(ref_path)
+        actual_img = load_image(actual_path)
+
+        if ref_img is None or actual_img is None:
+            return None
+
+        # Параметры сравнения читаем из settings один раз
+        diff_tolerance = getattr(settings, 'CV_DIFF_TOLERANCE', 0.12)
+        element_diff_ratio = getattr(settings, 'CV_ELEMENT_DIFF_RATIO', 0.12)
+        element_shift_px = getattr(settings, 'CV_ELEMENT_SHIFT_PX', 18)
+
+        actual_resized = resize_to_reference(actual_img, ref_img)
+        aligned_actual, diff_mask, ssim_score = compute_diff_mask(
+            ref_img,
+            actual_resized,
+            diff_threshold=diff_tolerance,
+        )
+
+        analysis = analyze_elements_diff(
+            testcase,
+            diff_mask,
+            missing_threshold=min(0.95, diff_tolerance + 0.45),
+            changed_threshold=max(0.15, element_diff_ratio),
+            min_ratio=element_diff_ratio,
+            max_shift_px=element_shift_px,
+        )
+
+        rel_path = render_comparison_visualization(run, ref_img, diff_mask, analysis)
+        if rel_path is None:
+            return None
+
+        run.comparison_vis_path = rel_path
+        run.save(update_fields=['comparison_vis_path'])
+
+        return build_comparison_report(run, analysis, ssim_score, f'{settings.MEDIA_URL}{rel_path}')
+    except Exception as e:
+        logger.error(f"Error creating comparison report: {e}")
+        return None
+
+
+def get_comparison_report(run):
+    """
+    Отчет сравнения прогона из сохраненных результатов задачи
+    (details, reference_diff_score, comparison_vis_path) без обработки изображений.
+    Если визуализация отсутствует или устарела, сравнение пересчитывается.
+    """
+    testcase = run.testcase
+    vis_url = visualization_url(
+        run.comparison_vis_path,
+        testcase.reference_screenshot.path,
+        run.actual_screenshot.path,
+    )
+    if vis_url and run.details and run.reference_diff_score is not None:
+        try:
+            analysis = json.loads(run.details)
+        except ValueError:
+            analysis = None
+        if isinstance(analysis, dict) and 'elements' in analysis and 'stats' in analysis:
+            return build_comparison_report(run, analysis, run.reference_diff_score, vis_url)
+
+    return create_comparison_report(run)
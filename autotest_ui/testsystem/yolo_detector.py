@@ -5,8 +5,10 @@
 """
 import os
 import logging
+import threading
 import numpy as np
 import cv2
+from PIL import Image
 from typing import List, Dict, Optional, Tuple
 from django.conf import settings
 
@@ -27,18 +29,94 @@ MODEL_PATH = os.path.join(
     'yolov8s.pt'
 )
 
+# TensorRT-движок (FP16), экспортированный из той же модели; если он есть, используется в первую очередь
+ENGINE_PATH = os.path.join(
+    os.path.dirname(__file__),
+    'ml_models',
+    'yolov8s.engine'
+)
+
+# INT8-модель OpenVINO для машин без GPU (каталог, который создает экспорт ultralytics)
+CPU_INT8_PATH = os.path.join(
+    os.path.dirname(__file__),
+    'ml_models',
+    'yolov8s_int8_openvino_model'
+)
+
+# Порядок поиска весов модели
+MODEL_PATHS = (ENGINE_PATH, CPU_INT8_PATH, MODEL_PATH)
+
+# Размер входа модели (используется для прогрева)
+YOLO_IMGSZ = 640
+
+# Параметры детекции по умолчанию (если вызывающий код не передал свои).
+# Полезных элементов на UI-скриншоте редко больше сотни; меньший max_det сокращает буфер NMS.
+# Для очень плотных дашбордов YOLO_MAX_DET можно поднять до 500.
+YOLO_MAX_DET = getattr(settings, 'YOLO_MAX_DET', 128)
+YOLO_DEFAULT_CONF = getattr(settings, 'YOLO_CONF_THRESHOLD', 0.2)
+
+# Максимальный размер пачки для detect_elements_yolo_batch (совпадает с batch при экспорте движка)
+YOLO_BATCH_SIZE = 16
+
+# Скриншоты, у которых длинная сторона больше этого порога, декодируются в уменьшенном виде:
+# модель все равно сжимает вход до YOLO_IMGSZ, полное разрешение не дает выигрыша в качестве
+YOLO_REDUCED_DECODE_MIN_SIDE = 1280
+
+# Флаги cv2.imread для декодирования с уменьшением в 2/4/8 раз
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
 # Глобальная переменная для кэширования модели
 _yolo_model = None
 
+# Блокировка загрузки: модель инициализирует только один поток, остальные ждут и используют ее
+_yolo_model_lock = threading.Lock()
+
+# Инференс в FP16 (только на CUDA); определяется при загрузке модели
+_yolo_half = False
+
+# Названия классов загруженной модели (id -> название); читаются один раз при загрузке
+_yolo_names: Dict[int, str] = {}
+
+# Результат is_yolo_available(); вычисляется один раз на процесс (None — еще не проверялось)
+_yolo_available_cached: Optional[bool] = None
+
+
+def _cuda_available() -> bool:
+    """Проверяет, доступна ли CUDA для инференса."""
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+
+def _warmup(model) -> None:
+    """
+    Прогоняет пустое изображение через модель, чтобы построение контекста
+    (TensorRT, CUDA-ядра) произошло при загрузке, а не на первом запросе.
+    """
+    try:
+        dummy = np.zeros((YOLO_IMGSZ, YOLO_IMGSZ, 3), dtype=np.uint8)
+        model.predict(dummy, imgsz=YOLO_IMGSZ, half=_yolo_half, verbose=False)
+    except Exception as e:
+        logger.warning(f"YOLOv8 warmup failed: {e}")
+
 
 def load_yolo_model() -> Optional[any]:
     """
     Загружает модель YOLOv8. Использует кэширование для избежания повторной загрузки.
+    Если рядом с весами лежит TensorRT-движок (yolov8s.engine) и есть CUDA, загружается он;
+    без CUDA предпочитается INT8-модель OpenVINO (yolov8s_int8_openvino_model).
     
     Returns:
         Загруженная модель YOLO или None если не удалось загрузить
     """
-    global _yolo_model
+    global _yolo_model, _yolo_half, _yolo_names
     
     if not YOLO_AVAILABLE:
         logger.warning("YOLO not available: ultralytics not installed")
@@ -47,42 +125,136 @@ def load_yolo_model() -> Optional[any]:
     if _yolo_model is not None:
         return _yolo_model
     
-    if not os.path.exists(MODEL_PATH):
-        logger.error(f"YOLOv8 model not found at {MODEL_PATH}")
-        return None
-    
-    try:
-        _yolo_model = YOLO(MODEL_PATH)
-        logger.info(f"YOLOv8 model loaded successfully from {MODEL_PATH}")
-        return _yolo_model
-    except Exception as e:
-        logger.error(f"Failed to load YOLOv8 model: {e}")
+    with _yolo_model_lock:
+        # Повторная проверка: модель могла загрузить другой поток, пока этот ждал блокировку
+        if _yolo_model is not None:
+            return _yolo_model
+        
+        cuda = _cuda_available()
+        for path in MODEL_PATHS:
+            if not os.path.exists(path):
+                continue
+            # Движок TensorRT работает только на GPU, INT8-модель OpenVINO — только на CPU
+            if path == ENGINE_PATH and not cuda:
+                continue
+            if path == CPU_INT8_PATH and cuda:
+                continue
+            try:
+                model = YOLO(path, task='detect')
+            except Exception as e:
+                logger.error(f"Failed to load YOLOv8 model from {path}: {e}")
+                continue
+            
+            _yolo_half = cuda
+            _yolo_names = dict(getattr(model, 'names', None) or {})
+            _warmup(model)
+            _yolo_model = model
+            logger.info(f"YOLOv8 model loaded successfully from {path} (half={_yolo_half})")
+            return _yolo_model
+        
+        logger.error(f"No loadable YOLOv8 model found (checked {', '.join(MODEL_PATHS)})")
         return None
 
 
 def is_yolo_available() -> bool:
-    """Проверяет, доступна ли модель YOLOv8."""
-    if not YOLO_AVAILABLE:
-        return False
-    if not os.path.exists(MODEL_PATH):
-        return False
-    return load_yolo_model() is not None
+    """
+    Проверяет, доступна ли модель YOLOv8.
+    Результат кэшируется на время жизни процесса: новые веса подхватываются после перезапуска.
+    """
+    global _yolo_available_cached
+    
+    if _yolo_available_cached is not None:
+        return _yolo_available_cached
+    
+    if not YOLO_AVAILABLE or not any(os.path.exists(path) for path in MODEL_PATHS):
+        available = False
+    else:
+        available = load_yolo_model() is not None
+    _yolo_available_cached = available
+    return available
+
+
+def _boxes_to_elements(result, w: int, h: int, names: Dict[int, str]) -> List[Dict]:
+    """
+    Преобразует детекции одного изображения (ultralytics Results) в список элементов
+    с относительными координатами (формат detect_elements_yolo).
+    names — словарь id класса -> название (_yolo_names).
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
+    
+    # Переносим тензоры на CPU целиком: одна копия на тензор вместо трех на каждый бокс
+    xyxy = boxes.xyxy.cpu().numpy()
+    confs = boxes.conf.cpu().numpy()
+    clss = boxes.cls.cpu().numpy().astype(np.int32)
+    
+    # Коррекция координат для точности (сразу для всех боксов)
+    # YOLOv8 может давать координаты с небольшим смещением влево и вверх
+    # Нужно сдвинуть правее (увеличить x1) и ниже (увеличить y1)
+    x1, y1, x2, y2 = xyxy.T
+    raw_w = x2 - x1
+    raw_h = y2 - y1
+    
+    # Для маленьких элементов коррекция более агрессивная:
+    # сдвиг вправо на 2-4px и вниз на 2-3px, для больших — 1-3px и 1-2px
+    small = (raw_w < 50) | (raw_h < 50)
+    correction_x_right = np.where(
+        small,
+        np.clip(np.trunc(raw_w * 0.08), 2, 4),
+        np.clip(np.trunc(raw_w * 0.015), 1, 3),
+    ).astype(xyxy.dtype)
+    correction_y_down = np.where(
+        small,
+        np.clip(np.trunc(raw_h * 0.06), 2, 3),
+        np.clip(np.trunc(raw_h * 0.01), 1, 2),
+    ).astype(xyxy.dtype)
+    
+    # Сдвигаем с сохранением размера и убеждаемся, что координаты в пределах изображения
+    x1 = np.clip(x1 + correction_x_right, 0, w - 1)
+    y1 = np.clip(y1 + correction_y_down, 0, h - 1)
+    x2 = np.maximum(x1 + 1, np.minimum(x2 + correction_x_right, w))
+    y2 = np.maximum(y1 + 1, np.minimum(y2 + correction_y_down, h))
+    
+    # Относительные координаты (x, y — левый верхний угол) и площадь считаем массивами,
+    # затем собираем словари одним проходом
+    abs_w = x2 - x1
+    abs_h = y2 - y1
+    rel_x = (x1.astype(np.float64) / w).tolist()
+    rel_y = (y1.astype(np.float64) / h).tolist()
+    rel_w = (abs_w.astype(np.float64) / w).tolist()
+    rel_h = (abs_h.astype(np.float64) / h).tolist()
+    areas = (abs_w * abs_h).tolist()
+    class_names = [names.get(class_id, f"class_{class_id}") for class_id in clss.tolist()]
+    
+    elements = [
+        {
+            'bbox': {'x': bx, 'y': by, 'w': bw, 'h': bh},
+            'class_name': class_name,
+            'confidence': confidence,
+            'area': area,
+        }
+        for bx, by, bw, bh, class_name, confidence, area
+        in zip(rel_x, rel_y, rel_w, rel_h, class_names, confs.tolist(), areas)
+    ]
+    
+    return elements
 
 
 def detect_elements_yolo(
     img: np.ndarray,
-    conf_threshold: float = 0.15,  # Снижен с 0.25 для лучшего обнаружения
+    conf_threshold: Optional[float] = None,
     iou_threshold: float = 0.4,  # Снижен с 0.45 для меньшей фильтрации
-    max_detections: int = 500  # Увеличен с 300 для большего количества детекций
+    max_detections: Optional[int] = None
 ) -> List[Dict]:
     """
     Детектирует UI элементы на изображении с помощью YOLOv8.
     
     Args:
         img: Изображение в формате numpy array (BGR, как в OpenCV)
-        conf_threshold: Порог уверенности для детекций (0.0-1.0)
+        conf_threshold: Порог уверенности для детекций (0.0-1.0), по умолчанию YOLO_CONF_THRESHOLD
         iou_threshold: Порог IoU для NMS (Non-Maximum Suppression)
-        max_detections: Максимальное количество детекций
+        max_detections: Максимальное количество детекций, по умолчанию YOLO_MAX_DET
         
     Returns:
         Список словарей с информацией о детектированных элементах:
@@ -96,6 +268,11 @@ def detect_elements_yolo(
             ...
         ]
     """
+    if conf_threshold is None:
+        conf_threshold = YOLO_DEFAULT_CONF
+    if max_detections is None:
+        max_detections = YOLO_MAX_DET
+    
     model = load_yolo_model()
     if model is None:
         logger.warning("YOLOv8 model not available, returning empty list")
@@ -107,95 +284,24 @@ def detect_elements_yolo(
     
     try:
         h, w = img.shape[:2]
-        total_area = w * h
         
-        # YOLO ожидает RGB изображение, а OpenCV использует BGR
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        # ultralytics принимает numpy-массивы в BGR (как OpenCV) и сам переставляет каналы
+        # при препроцессинге — передаем изображение как есть, без копии
         
         # Выполняем детекцию
         results = model.predict(
-            img_rgb,
+            img,
             conf=conf_threshold,
             iou=iou_threshold,
             max_det=max_detections,
+            half=_yolo_half,
             verbose=False  # Отключаем вывод в консоль
         )
         
         elements = []
-        
-        # Обрабатываем результаты
         if results and len(results) > 0:
-            result = results[0]  # Берем первый результат (одно изображение)
-            
-            # Проверяем наличие детекций
-            if result.boxes is not None and len(result.boxes) > 0:
-                boxes = result.boxes
-                
-                for i in range(len(boxes)):
-                    # Получаем координаты в формате xyxy (абсолютные)
-                    box = boxes.xyxy[i].cpu().numpy()
-                    x1, y1, x2, y2 = box
-                    
-                    # Коррекция координат для точности
-                    # YOLOv8 может давать координаты с небольшим смещением влево и вверх
-                    # Нужно сдвинуть правее (увеличить x1) и ниже (увеличить y1)
-                    abs_w_raw = x2 - x1
-                    abs_h_raw = y2 - y1
-                    
-                    # Коррекция смещения: сдвигаем вправо и вниз
-                    # Для маленьких элементов коррекция более агрессивная
-                    if abs_w_raw < 50 or abs_h_raw < 50:
-                        # Для маленьких элементов: сдвиг вправо на 2-4px и вниз на 2-3px
-                        correction_x_right = max(2, min(4, int(abs_w_raw * 0.08)))  # Сдвиг вправо 2-4px
-                        correction_y_down = max(2, min(3, int(abs_h_raw * 0.06)))  # Сдвиг вниз 2-3px
-                        x1 = max(0, min(w - 1, x1 + correction_x_right))  # Сдвигаем вправо
-                        x2 = min(w, x2 + correction_x_right)  # Сохраняем ширину
-                        y1 = max(0, min(h - 1, y1 + correction_y_down))  # Сдвигаем вниз
-                        y2 = min(h, y2 + correction_y_down)  # Сохраняем высоту
-                    else:
-                        # Для больших элементов: меньший сдвиг
-                        correction_x_right = max(1, min(3, int(abs_w_raw * 0.015)))
-                        correction_y_down = max(1, min(2, int(abs_h_raw * 0.01)))
-                        x1 = max(0, min(w - 1, x1 + correction_x_right))
-                        x2 = min(w, x2 + correction_x_right)
-                        y1 = max(0, min(h - 1, y1 + correction_y_down))
-                        y2 = min(h, y2 + correction_y_down)
-                    
-                    # Получаем уверенность
-                    confidence = float(boxes.conf[i].cpu().numpy())
-                    
-                    # Получаем класс
-                    class_id = int(boxes.cls[i].cpu().numpy())
-                    class_name = model.names[class_id] if hasattr(model, 'names') else f"class_{class_id}"
-                    
-                    # Вычисляем относительные координаты
-                    abs_w = x2 - x1
-                    abs_h = y2 - y1
-                    
-                    # Убеждаемся, что координаты в пределах изображения
-                    x1 = max(0, min(x1, w - 1))
-                    y1 = max(0, min(y1, h - 1))
-                    x2 = max(x1 + 1, min(x2, w))
-                    y2 = max(y1 + 1, min(y2, h))
-                    abs_w = x2 - x1
-                    abs_h = y2 - y1
-                    
-                    # Сохраняем в формате, совместимом с существующим кодом: x, y - левый верхний угол
-                    bbox = {
-                        'x': float(x1) / w,  # относительная координата x левого верхнего угла
-                        'y': float(y1) / h,  # относительная координата y левого верхнего угла
-                        'w': float(abs_w) / w,  # относительная ширина
-                        'h': float(abs_h) / h   # относительная высота
-                    }
-                    
-                    area = abs_w * abs_h
-                    
-                    elements.append({
-                        'bbox': bbox,
-                        'class_name': class_name,
-                        'confidence': confidence,
-                        'area': float(area)
-                    })
+            # Берем первый результат (одно изображение)
+            elements = _boxes_to_elements(results[0], w, h, _yolo_names)
         
         logger.info(f"YOLOv8 detected {len(elements)} elements")
         return elements
@@ -205,20 +311,89 @@ def detect_elements_yolo(
         return []
 
 
+def detect_elements_yolo_batch(
+    imgs: List[np.ndarray],
+    conf_threshold: Optional[float] = None,
+    iou_threshold: float = 0.4,
+    max_detections: Optional[int] = None
+) -> List[List[Dict]]:
+    """
+    Детектирует UI элементы сразу на нескольких изображениях (BGR).
+    Изображения передаются в модель пачками по YOLO_BATCH_SIZE — один вызов
+    predict на пачку вместо вызова на каждый скриншот.
+    
+    Returns:
+        Список результатов в порядке входных изображений (формат detect_elements_yolo);
+        для пустых изображений и при ошибке — пустой список.
+    """
+    detections = [[] for _ in imgs]
+    if conf_threshold is None:
+        conf_threshold = YOLO_DEFAULT_CONF
+    if max_detections is None:
+        max_detections = YOLO_MAX_DET
+    
+    model = load_yolo_model()
+    if model is None:
+        logger.warning("YOLOv8 model not available, returning empty results")
+        return detections
+    
+    names = _yolo_names
+    valid = [i for i, img in enumerate(imgs) if img is not None and img.size > 0]
+    
+    for start in range(0, len(valid), YOLO_BATCH_SIZE):
+        chunk = valid[start:start + YOLO_BATCH_SIZE]
+        try:
+            # Изображения передаются в BGR без конвертации (см. detect_elements_yolo)
+            batch = [imgs[i] for i in chunk]
+            results = model.predict(
+                batch,
+                conf=conf_threshold,
+                iou=iou_threshold,
+                max_det=max_detections,
+                half=_yolo_half,
+                verbose=False
+            )
+            for i, result in zip(chunk, results):
+                h, w = imgs[i].shape[:2]
+                detections[i] = _boxes_to_elements(result, w, h, names)
+        except Exception as e:
+            logger.error(f"Error during YOLOv8 batch detection: {e}", exc_info=True)
+    
+    logger.info(f"YOLOv8 batch detected {sum(len(d) for d in detections)} elements on {len(valid)} images")
+    return detections
+
+
+def _auto_decode_scale(image_path: str) -> int:
+    """
+    Выбирает коэффициент уменьшения при декодировании по размеру изображения.
+    Размер читается из заголовка файла, без декодирования пикселей.
+    """
+    try:
+        with Image.open(image_path) as probe:
+            longest_side = max(probe.size)
+    except Exception:
+        return 1
+    return 2 if longest_side > YOLO_REDUCED_DECODE_MIN_SIDE else 1
+
+
 def detect_elements_yolo_from_path(
     image_path: str,
-    conf_threshold: float = 0.25,
+    conf_threshold: Optional[float] = None,
     iou_threshold: float = 0.45,
-    max_detections: int = 300
+    max_detections: Optional[int] = None,
+    decode_scale: Optional[int] = None
 ) -> List[Dict]:
     """
     Детектирует UI элементы на изображении по пути к файлу.
     
     Args:
         image_path: Путь к файлу изображения
-        conf_threshold: Порог уверенности для детекций (0.0-1.0)
+        conf_threshold: Порог уверенности для детекций (0.0-1.0), по умолчанию YOLO_CONF_THRESHOLD
         iou_threshold: Порог IoU для NMS
-        max_detections: Максимальное количество детекций
+        max_detections: Максимальное количество детекций, по умолчанию YOLO_MAX_DET
+        decode_scale: Во сколько раз уменьшить изображение при декодировании (1, 2, 4 или 8).
+            По умолчанию 2 для изображений с длинной стороной больше
+            YOLO_REDUCED_DECODE_MIN_SIDE, иначе 1
         
     Returns:
         Список словарей с информацией о детектированных элементах
@@ -227,13 +402,26 @@ def detect_elements_yolo_from_path(
         logger.error(f"Image file not found: {image_path}")
         return []
     
-    # Загружаем изображение через OpenCV
-    img = cv2.imread(image_path)
+    if decode_scale is None:
+        decode_scale = _auto_decode_scale(image_path)
+    if decode_scale not in REDUCED_DECODE_FLAGS:
+        raise ValueError(f"decode_scale must be one of {sorted(REDUCED_DECODE_FLAGS)}, got {decode_scale}")
+    
+    # Загружаем изображение через OpenCV (декодер сразу пропускает лишние пиксели)
+    img = cv2.imread(image_path, REDUCED_DECODE_FLAGS[decode_scale])
     if img is None:
         logger.error(f"Failed to load image: {image_path}")
         return []
     
-    return detect_elements_yolo(img, conf_threshold, iou_threshold, max_detections)
+    elements = detect_elements_yolo(img, conf_threshold, iou_threshold, max_detections)
+    
+    # Относительные координаты не зависят от масштаба, площадь возвращаем в пикселях оригинала
+    if decode_scale != 1:
+        area_scale = decode_scale * decode_scale
+        for elem in elements:
+            elem['area'] *= area_scale
+    
+    return elements
 
 
 def get_yolo_model_info() -> Dict:
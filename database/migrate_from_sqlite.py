@@ -16,12 +16,57 @@ sys.path.insert(0, str(BASE_DIR / 'autotest_ui'))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'autotest_ui.settings')
 django.setup()
 
-from django.db import connections
+from django.core.management.color import no_style
+from django.db import connections, transaction
 from django.core.management import call_command
 from testsystem.models import TestCase, Run, UIElement, CoverageMetric, Defect
 from django.contrib.auth.models import User
 
 
+# Размер пачки для bulk_create
+BULK_BATCH_SIZE = 1000
+
+
+def copy_rows(model):
+    """
+    Копирует строки модели из SQLite в PostgreSQL с сохранением ID.
+    Источник читается потоком через iterator(), отсутствующие в PostgreSQL строки
+    вставляются пачками по BULK_BATCH_SIZE в одной транзакции — в памяти держится
+    не больше одной пачки.
+    
+    Returns:
+        Tuple (мигрировано, всего в источнике)
+    """
+    source_total = model.objects.using('sqlite').count()
+    # ID уже перенесенных строк — один запрос вместо проверки exists() на каждую строку
+    existing_ids = set(model.objects.using('default').values_list('id', flat=True))
+    migrated = 0
+    batch = []
+    with transaction.atomic(using='default'):
+        for obj in model.objects.using('sqlite').iterator(chunk_size=BULK_BATCH_SIZE):
+            if obj.id in existing_ids:
+                continue
+            batch.append(obj)
+            if len(batch) >= BULK_BATCH_SIZE:
+                model.objects.using('default').bulk_create(batch, ignore_conflicts=True)
+                migrated += len(batch)
+                batch = []
+        if batch:
+            model.objects.using('default').bulk_create(batch, ignore_conflicts=True)
+            migrated += len(batch)
+    return migrated, source_total
+
+
+def reset_sequences(connection, models):
+    """Синхронизирует последовательности ID с данными после вставки с явными ID."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if not statements:
+        return
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
 def migrate_data():
     """Миграция данных из SQLite в PostgreSQL"""
     
@@ -57,86 +102,43 @@ def migrate_data():
     print("\n[1/5] Миграция пользователей...")
     users_count = User.objects.using('sqlite').count()
     if users_count > 0:
-        users = User.objects.using('sqlite').all()
-        migrated_users = 0
-        for user in users:
-            if not User.objects.using('default').filter(username=user.username).exists():
+        existing_usernames = set(User.objects.using('default').values_list('username', flat=True))
+        new_users = []
+        for user in User.objects.using('sqlite').iterator(chunk_size=BULK_BATCH_SIZE):
+            if user.username not in existing_usernames:
                 user.pk = None
-                user.save(using='default')
-                migrated_users += 1
-        print(f"  Мигрировано пользователей: {migrated_users}/{users_count}")
+                new_users.append(user)
+        with transaction.atomic(using='default'):
+            User.objects.using('default').bulk_create(new_users, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+        print(f"  Мигрировано пользователей: {len(new_users)}/{users_count}")
     else:
         print("  Пользователей для миграции нет")
     
     # Миграция тест-кейсов
     print("\n[2/5] Миграция тест-кейсов...")
-    testcases = TestCase.objects.using('sqlite').all()
-    migrated_testcases = 0
-    for tc in testcases:
-        if not TestCase.objects.using('default').filter(id=tc.id).exists():
-            # Сохраняем оригинальный ID
-            original_id = tc.id
-            tc.pk = None
-            tc.save(using='default')
-            # Обновляем ID если нужно сохранить оригинальный
-            if original_id != tc.id:
-                TestCase.objects.using('default').filter(id=tc.id).update(id=original_id)
-            migrated_testcases += 1
-    print(f"  Мигрировано тест-кейсов: {migrated_testcases}/{testcases.count()}")
+    migrated, total = copy_rows(TestCase)
+    print(f"  Мигрировано тест-кейсов: {migrated}/{total}")
     
     # Миграция UI элементов
     print("\n[3/5] Миграция UI элементов...")
-    elements = UIElement.objects.using('sqlite').all()
-    migrated_elements = 0
-    for elem in elements:
-        if not UIElement.objects.using('default').filter(id=elem.id).exists():
-            original_id = elem.id
-            elem.pk = None
-            elem.save(using='default')
-            if original_id != elem.id:
-                UIElement.objects.using('default').filter(id=elem.id).update(id=original_id)
-            migrated_elements += 1
-    print(f"  Мигрировано элементов: {migrated_elements}/{elements.count()}")
+    migrated, total = copy_rows(UIElement)
+    print(f"  Мигрировано элементов: {migrated}/{total}")
     
     # Миграция прогонов
     print("\n[4/5] Миграция прогонов...")
-    runs = Run.objects.using('sqlite').all()
-    migrated_runs = 0
-    for run in runs:
-        if not Run.objects.using('default').filter(id=run.id).exists():
-            original_id = run.id
-            run.pk = None
-            run.save(using='default')
-            if original_id != run.id:
-                Run.objects.using('default').filter(id=run.id).update(id=original_id)
-            migrated_runs += 1
-    print(f"  Мигрировано прогонов: {migrated_runs}/{runs.count()}")
+    migrated, total = copy_rows(Run)
+    print(f"  Мигрировано прогонов: {migrated}/{total}")
     
     # Миграция метрик покрытия и дефектов
     print("\n[5/5] Миграция метрик и дефектов...")
-    metrics = CoverageMetric.objects.using('sqlite').all()
-    migrated_metrics = 0
-    for metric in metrics:
-        if not CoverageMetric.objects.using('default').filter(id=metric.id).exists():
-            original_id = metric.id
-            metric.pk = None
-            metric.save(using='default')
-            if original_id != metric.id:
-                CoverageMetric.objects.using('default').filter(id=metric.id).update(id=original_id)
-            migrated_metrics += 1
-    print(f"  Мигрировано метрик: {migrated_metrics}/{metrics.count()}")
+    migrated, total = copy_rows(CoverageMetric)
+    print(f"  Мигрировано метрик: {migrated}/{total}")
+    
+    migrated, total = copy_rows(Defect)
+    print(f"  Мигрировано дефектов: {migrated}/{total}")
     
-    defects = Defect.objects.using('sqlite').all()
-    migrated_defects = 0
-    for defect in defects:
-        if not Defect.objects.using('default').filter(id=defect.id).exists():
-            original_id = defect.id
-            defect.pk = None
-            defect.save(using='default')
-            if original_id != defect.id:
-                Defect.objects.using('default').filter(id=defect.id).update(id=original_id)
-            migrated_defects += 1
-    print(f"  Мигрировано дефектов: {migrated_defects}/{defects.count()}")
+    # Строки вставлены с явными ID — сдвигаем последовательности PostgreSQL за максимальный ID
+    reset_sequences(postgres_conn, [User, TestCase, UIElement, Run, CoverageMetric, Defect])
     
     print("\n" + "=" * 60)
     print("Миграция завершена успешно!")
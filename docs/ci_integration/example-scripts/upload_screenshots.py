@@ -6,17 +6,31 @@
 import argparse
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
-def upload_screenshot(api_url: str, token: str, testcase_id: int, screenshot_path: str) -> dict:
+def create_session(token: str = None) -> requests.Session:
+    """HTTP-сессия с пулом соединений: keep-alive вместо нового TCP/TLS рукопожатия на каждый запрос"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.5),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if token:
+        session.headers['Authorization'] = f'Token {token}'
+    return session
+
+
+def upload_screenshot(session: requests.Session, api_url: str, testcase_id: int, screenshot_path: str) -> dict:
     """Загрузка одного скриншота"""
     url = f"{api_url}/runs/"
     
-    headers = {}
-    if token:
-        headers['Authorization'] = f'Token {token}'
-    
     with open(screenshot_path, 'rb') as f:
         files = {
             'actual_screenshot': (os.path.basename(screenshot_path), f, 'image/png')
@@ -25,7 +39,7 @@ def upload_screenshot(api_url: str, token: str, testcase_id: int, screenshot_pat
             'testcase': testcase_id,
         }
         
-        response = requests.post(url, headers=headers, files=files, data=data)
+        response = session.post(url, files=files, data=data)
         response.raise_for_status()
         return response.json()
 
@@ -36,6 +50,7 @@ def main():
     parser.add_argument('--token', help='API token')
     parser.add_argument('--testcase-id', type=int, required=True, help='Test case ID')
     parser.add_argument('--screenshots-dir', required=True, help='Directory with screenshots')
+    parser.add_argument('--workers', type=int, default=8, help='Number of parallel uploads')
     
     args = parser.parse_args()
     
@@ -52,17 +67,20 @@ def main():
     
     print(f"Uploading {len(screenshots)} screenshots...")
     
-    for screenshot in screenshots:
-        try:
-            result = upload_screenshot(
-                args.api_url,
-                args.token,
-                args.testcase_id,
-                str(screenshot)
-            )
-            print(f"✓ Uploaded {screenshot.name}: Run ID {result['id']}")
-        except Exception as e:
-            print(f"✗ Failed to upload {screenshot.name}: {e}")
+    session = create_session(args.token)
+    # Загрузки независимы и упираются в сеть — выполняем их параллельно на общем пуле соединений
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(upload_screenshot, session, args.api_url, args.testcase_id, str(screenshot)): screenshot
+            for screenshot in screenshots
+        }
+        for future in as_completed(futures):
+            screenshot = futures[future]
+            try:
+                result = future.result()
+                print(f"✓ Uploaded {screenshot.name}: Run ID {result['id']}")
+            except Exception as e:
+                print(f"✗ Failed to upload {screenshot.name}: {e}")
     
     return 0
 
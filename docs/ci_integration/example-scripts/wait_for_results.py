@@ -7,14 +7,29 @@ import argparse
 import time
 import requests
 import sys
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
-def check_status(api_url: str, ci_job_id: str) -> dict:
+def create_session() -> requests.Session:
+    """HTTP-сессия с keep-alive: опросы статуса переиспользуют одно соединение"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=3, backoff_factor=0.5),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def check_status(session: requests.Session, api_url: str, ci_job_id: str) -> dict:
     """Проверка статуса прогонов"""
     url = f"{api_url}/runs/ci-status/"
     params = {'ci_job_id': ci_job_id}
     
-    response = requests.get(url, params=params)
+    response = session.get(url, params=params)
     response.raise_for_status()
     return response.json()
 
@@ -28,6 +43,7 @@ def main():
     
     args = parser.parse_args()
     
+    session = create_session()
     start_time = time.time()
     
     print(f"Waiting for results for CI job {args.ci_job_id}...")
@@ -40,7 +56,7 @@ def main():
             return 1
         
         try:
-            status = check_status(args.api_url, args.ci_job_id)
+            status = check_status(session, args.api_url, args.ci_job_id)
             summary = status['summary']
             
             print(f"[{elapsed:.0f}s] Status: {summary['overall_status']}, "